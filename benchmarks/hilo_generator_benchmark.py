@@ -0,0 +1,109 @@
+"""
+Multithreaded micro benchmark for HiloGenerator.
+
+The generator runs against an in-memory stand-in for the hilo documents that sleeps for a configurable
+latency on every call, so the numbers show the cost of the locking and of the range refills
+and not the speed of a real server.
+
+    python benchmarks/hilo_generator_benchmark.py --ids 200000 --latency 0.005
+"""
+from threading import Lock, Thread
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from pyravendb.custom_exceptions import exceptions
+from pyravendb.data.document_convention import DocumentConvention
+from pyravendb.hilo.hilo_generator import HiloGenerator
+from pyravendb.tools.utils import Utils
+
+
+class InMemoryHiloCommands(object):
+    """
+    Implements the two DatabaseCommands calls the generator makes (get and batch) over a dict
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.documents = {}
+        self.etag = 0
+        self.requests = 0
+        self.lock = Lock()
+
+    def get(self, keys, primary_only=False):
+        time.sleep(self.latency)
+        with self.lock:
+            self.requests += 1
+            results = []
+            for key in keys:
+                if key in self.documents:
+                    document, etag = self.documents[key]
+                    results.append({"Max": document["Max"], "@metadata": {"@etag": etag}})
+                else:
+                    results.append(None)
+            return {"Results": results, "Includes": []}
+
+    def batch(self, commands, primary_only=False):
+        time.sleep(self.latency)
+        with self.lock:
+            self.requests += 1
+            for command in commands:
+                current_etag = self.documents[command.key][1] if command.key in self.documents else Utils.empty_etag()
+                if command.etag != current_etag:
+                    raise exceptions.FetchConcurrencyException("Etag mismatch on {0}".format(command.key))
+            for command in commands:
+                self.etag += 1
+                self.documents[command.key] = (command.document, str(self.etag))
+            return [{"Method": "PUT", "Key": command.key} for command in commands]
+
+
+def _entity_class(index):
+    return type("Entity{0}".format(index), (object,), {})
+
+
+def run(thread_count, ids_per_thread, latency, shared_collection):
+    conventions = DocumentConvention()
+    commands = InMemoryHiloCommands(latency)
+    generator = HiloGenerator(conventions.max_ids_to_catch, commands, conventions.max_hilo_capacity,
+                              conventions.hilo_prefetch_low_water_mark)
+    entity_classes = [_entity_class(0 if shared_collection else i) for i in range(thread_count)]
+    results = [None] * thread_count
+
+    def work(index):
+        entity = entity_classes[index]()
+        results[index] = [generator.generate_document_id(entity, conventions, None) for _ in range(ids_per_thread)]
+
+    threads = [Thread(target=work, args=(i,)) for i in range(thread_count)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    ids = [key for result in results for key in result]
+    if len(ids) != len(set(ids)):
+        raise AssertionError("Duplicate ids were generated")
+    return len(ids) / elapsed, commands.requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ids", type=int, default=100000, help="ids generated by each thread")
+    parser.add_argument("--latency", type=float, default=0.005, help="simulated round trip in seconds")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    print("{0:>8} {1:>12} {2:>14} {3:>10}".format("threads", "collections", "ids/sec", "requests"))
+    for shared_collection in (True, False):
+        for thread_count in args.threads:
+            ids_per_sec, requests = run(thread_count, args.ids, args.latency, shared_collection)
+            print("{0:>8} {1:>12} {2:>14,.0f} {3:>10}".format(thread_count, 1 if shared_collection else thread_count,
+                                                             ids_per_sec, requests))
+
+
+if __name__ == "__main__":
+    main()
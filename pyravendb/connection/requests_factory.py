@@ -40,9 +40,23 @@ class HttpRequestsFactory(object):
         self._token = None
         self._current_api_key = None
         self._current_database = None
+        self._topology_file = None
+        # destinations we keep checking with is_alive until they respond again
+        self._unreachable_destinations = {}
 
     def http_request_handler(self, path, method, data=None, headers=None, admin=False, force_read_from_master=False,
-                             uri="databases"):
+                             uri="databases", stream=False, raw_data=False, primary_only=False):
+        """
+        @param primary_only: True to send the request only to the primary (no failover to the secondaries),
+        e.g. for the hilo documents (the replication topology is always primary only)
+        :type bool
+        @param stream: True to read the content of the response as it arrives (with iter_content)
+        instead of downloading all of it before returning
+        :type bool
+        @param raw_data: True to send the data as it is (bytes or a generator of bytes for a chunked request)
+        instead of as json
+        :type bool
+        """
         if self.force_get_topology:
             self.force_get_topology = False
             self.get_replication_topology()
@@ -55,12 +69,18 @@ class HttpRequestsFactory(object):
             uri = self.convention.system_database
 
         return self._execute_with_replication(path, method, headers=headers, data=data, admin=admin,
-                                              force_read_from_master=force_read_from_master, uri=uri)
+                                              force_read_from_master=force_read_from_master, uri=uri, stream=stream,
+                                              raw_data=raw_data, primary_only=primary_only)
 
     def _execute_with_replication(self, path, method, headers, data=None, admin=False,
-                                  force_read_from_master=False, uri="databases"):
+                                  force_read_from_master=False, uri="databases", stream=False, raw_data=False,
+                                  primary_only=False):
         second_api_key = None
+        primary_only = primary_only or path == "replication/topology"
         while True:
+            if primary_only and not self.primary:
+                raise exceptions.InvalidOperationException(
+                    "Cant get access to {0} when {1}(primary) is Down".format(path, self._primary_database))
             index = None
             url = None
             if not force_read_from_master:
@@ -69,10 +89,7 @@ class HttpRequestsFactory(object):
                     second_api_key = self.api_key
                 else:
                     if method == "GET":
-                        if (path == "replication/topology" or "Hilo" in path) and not self.primary:
-                            raise exceptions.InvalidOperationException(
-                                "Cant get access to {0} when {1}(primary) is Down".format(path, self._primary_database))
-                        elif self.convention.failover_behavior == Failover.read_from_all_servers:
+                        if self.convention.failover_behavior == Failover.read_from_all_servers and not primary_only:
                             with self.lock:
                                 self.request_count += 1
                                 index = self.request_count % (len(self.replication_topology) + 1)
@@ -106,8 +123,9 @@ class HttpRequestsFactory(object):
                 if headers is None:
                     headers = {}
                 headers.update(self.headers)
-                data = json.dumps(data, default=self.convention.json_default_method)
-                response = session.request(method, url=url, data=data, headers=headers)
+                if not raw_data:
+                    data = json.dumps(data, default=self.convention.json_default_method)
+                response = session.request(method, url=url, data=data, headers=headers, stream=stream)
                 if response.status_code == 412 or response.status_code == 401:
                     try:
                         oauth_source = response.headers.__getitem__("OAuth-Source")
@@ -117,8 +135,7 @@ class HttpRequestsFactory(object):
                     self.do_auth_request(self.api_key, oauth_source, second_api_key)
                     continue
                 if (response.status_code == 503 or response.status_code == 502) and \
-                        not self.replication_topology.empty() and not (
-                                path == "replication/topology" or "Hilo" in path):
+                        not self.replication_topology.empty() and not primary_only:
                     if self.primary:
                         if self.convention.failover_behavior == Failover.fail_immediately or force_read_from_master:
                             raise exceptions.ErrorResponseException("Failed to get response from server")
@@ -158,6 +175,7 @@ class HttpRequestsFactory(object):
                     except exceptions.ErrorResponseException:
                         break
                 if response.status_code == 200:
+                    self._unreachable_destinations.pop((destination["url"], destination["database"]), None)
                     if primary:
                         self.primary = True
                     else:
@@ -165,6 +183,7 @@ class HttpRequestsFactory(object):
                     return
                 else:
                     break
+            self._unreachable_destinations[(destination["url"], destination["database"])] = (destination, primary)
             is_alive_timer = Timer(5, lambda: self.is_alive(destination, primary))
             is_alive_timer.daemon = True
             is_alive_timer.start()
@@ -172,16 +191,6 @@ class HttpRequestsFactory(object):
     def check_database_exists(self, path):
         return self.http_request_handler(path, "GET", force_read_from_master=True, uri="docs")
 
-    def call_hilo(self, type_tag_name, max_id, etag):
-        headers = {"if-None-Match": etag}
-        put_url = "docs/Raven%2FHilo%2F{0}".format(type_tag_name)
-        response = self.http_request_handler(put_url, "PUT", data={"Max": max_id},
-                                             headers=headers)
-        if response.status_code == 409:
-            raise exceptions.FetchConcurrencyException(response.json["Error"])
-        if response.status_code != 201:
-            raise exceptions.ErrorResponseException("Something is wrong with the request")
-
     def update_replication(self, topology_file):
         with open(topology_file, 'w+') as f:
             f.write(json.dumps(self.topology))
@@ -204,9 +213,32 @@ class HttpRequestsFactory(object):
         except exceptions.InvalidOperationException:
             pass
         if not self.database.lower() == self.convention.system_database:
-            timer = Timer(60 * 5, lambda: self.check_replication_change(topology_file))
-            timer.daemon = True
-            timer.start()
+            self._topology_file = topology_file
+            self._schedule_replication_check()
+
+    def _schedule_replication_check(self):
+        timer = Timer(60 * 5, lambda: self.check_replication_change(self._topology_file))
+        timer.daemon = True
+        timer.start()
+
+    def after_fork(self):
+        """
+        Reset the state that does not survive a fork, must be called in the child process.
+        The topology we already know is kept so the child does not need to fetch it again
+        """
+        self.lock = Lock()
+        # The queue has its own locks that may have been held by another thread of the parent
+        replication_topology = IndexQueue()
+        for destination in list(self.replication_topology.queue):
+            replication_topology.put(destination)
+        self.replication_topology = replication_topology
+        # Only the forking thread exists in the child, the replication and is_alive timers did not survive
+        if self._topology_file is not None:
+            self._schedule_replication_check()
+        for destination, primary in list(self._unreachable_destinations.values()):
+            is_alive_timer = Timer(5, lambda d=destination, p=primary: self.is_alive(d, p))
+            is_alive_timer.daemon = True
+            is_alive_timer.start()
 
     def get_replication_topology(self):
         with self.lock:
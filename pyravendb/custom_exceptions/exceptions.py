@@ -21,5 +21,20 @@ class FetchConcurrencyException(Exception):
 class ArgumentOutOfRangeException(Exception):
     pass
 
+
+class SaveChangesException(Exception):
+    def __init__(self, message, errors=None):
+        super(SaveChangesException, self).__init__(message)
+        # The errors of the batches that were not saved
+        self.errors = [] if errors is None else errors
+
 class TimeoutException(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class SubscriptionInUseException(Exception):
+    pass
+
+
+class SubscriptionDoesNotExistException(Exception):
+    pass
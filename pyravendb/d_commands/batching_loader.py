@@ -0,0 +1,93 @@
+from threading import Event, Lock
+import collections
+import copy
+import time
+
+
+class _Batch(object):
+    def __init__(self, force_read_from_master):
+        self.force_read_from_master = force_read_from_master
+        self.keys = collections.OrderedDict()
+        self.done = Event()
+        self.documents = None
+        self.response = None
+        self.error = None
+
+
+class BatchingLoader(object):
+    """
+    Merges the gets of documents that threads make within a short window into a single request.
+
+    The first thread that asks for documents opens a batch and waits for the window to pass, the threads
+    that ask for documents meanwhile add their keys to that batch and wait for its result.
+    Then the first thread gets all the keys with one request and every thread receives its own documents
+    """
+
+    def __init__(self, database_commands, window):
+        """
+        @param database_commands: the commands we send the merged get with
+        :type DatabaseCommands
+        @param window: the time (in seconds) a batch waits for other gets before it is sent
+        :type float
+        """
+        self.database_commands = database_commands
+        self.window = window
+        self.lock = Lock()
+        self._batches = {}
+
+    def reset(self):
+        # For a forked child, the threads that waited on the batches of the parent do not exist
+        self.lock = Lock()
+        self._batches = {}
+
+    def get(self, key_or_keys, force_read_from_master=False):
+        """
+        @param key_or_keys: the key of the documents you want to retrieve (key can be a list of ids)
+        :type str or list
+        @return: the same result DatabaseCommands.get returns for these keys
+        :rtype: dict
+        """
+        keys = key_or_keys if isinstance(key_or_keys, list) else [key_or_keys]
+        with self.lock:
+            batch = self._batches.get(force_read_from_master, None)
+            leader = batch is None
+            if leader:
+                batch = _Batch(force_read_from_master)
+                self._batches[force_read_from_master] = batch
+            for key in keys:
+                # The number of callers that asked for the key
+                batch.keys[key] = batch.keys.get(key, 0) + 1
+
+        if leader:
+            time.sleep(self.window)
+            with self.lock:
+                self._batches.pop(force_read_from_master, None)
+            self._execute(batch)
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        if batch.documents is None:
+            # Not a successful response, every caller gets it as it is
+            return batch.response
+        results = []
+        for key in keys:
+            document = batch.documents[key]
+            if document is not None and batch.keys[key] > 1:
+                # The session changes the documents it gets, a key asked for more than once is copied for each caller
+                document = copy.deepcopy(document)
+            results.append(document)
+        return {"Results": results, "Includes": []}
+
+    def _execute(self, batch):
+        try:
+            keys = list(batch.keys)
+            batch.response = self.database_commands.get(keys, force_read_from_master=batch.force_read_from_master,
+                                                        use_batching=False)
+            if isinstance(batch.response, dict):
+                batch.documents = dict(zip(keys, batch.response["Results"]))
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
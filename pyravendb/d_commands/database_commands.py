@@ -5,13 +5,17 @@ from pyravendb.data.patches import ScriptedPatchRequest
 from pyravendb.data.indexes import IndexDefinition
 from pyravendb.custom_exceptions import exceptions
 from pyravendb.tools.utils import Utils
+from pyravendb.tools import json_stream
 import collections
+import time
 
 
 class DatabaseCommands(object):
     def __init__(self, request_handler):
         self._requests_handler = request_handler
         self.admin_commands = self.Admin(self._requests_handler)
+        # Merges the gets of concurrent threads into one request (see DocumentConvention.load_batching_window)
+        self.batching_loader = None
 
     def change_database(self, database):
         self._requests_handler.database = database
@@ -32,7 +36,8 @@ class DatabaseCommands(object):
         async_result = pool.apply_async(func, func_parameter)
         return async_result.get()
 
-    def get(self, key_or_keys, includes=None, metadata_only=False, force_read_from_master=False):
+    def get(self, key_or_keys, includes=None, metadata_only=False, force_read_from_master=False, use_batching=True,
+            primary_only=False):
         """
         @param key_or_keys: the key of the documents you want to retrieve (key can be a list of ids)
         :type str or list
@@ -44,6 +49,32 @@ class DatabaseCommands(object):
         :rtype: dict
         @param force_read_from_master: If True the reading also will be from the master
         :type bool
+        @param use_batching: False to send the request on its own even when the batching loader is enabled
+        :type bool
+        @param primary_only: True to read only from the primary (no failover to the secondaries)
+        :type bool
+        """
+        if use_batching and not primary_only and self.batching_loader is not None and not includes \
+                and not metadata_only:
+            keys = key_or_keys if isinstance(key_or_keys, list) else [key_or_keys]
+            # The system documents (e.g. the hilo documents) are not delayed
+            if keys and not any(key is None or key.startswith("Raven/") for key in keys):
+                return self.batching_loader.get(key_or_keys, force_read_from_master)
+        path, method, data = self.build_get_request(key_or_keys, includes, metadata_only)
+        response = self._requests_handler.http_request_handler(path, method, data=data,
+                                                               force_read_from_master=force_read_from_master,
+                                                               primary_only=primary_only)
+        if response.status_code == 200:
+            response = response.json()
+        return response
+
+    @staticmethod
+    def build_get_request(key_or_keys, includes=None, metadata_only=False, allow_post=True):
+        """
+        @param allow_post: False to always put the keys in the path (e.g. for a multi_get request)
+        :type bool
+        @return: the path (relative to the database), the method and the data of the request that gets the documents
+        :rtype: tuple
         """
         if key_or_keys is None:
             raise ValueError("None Key is not valid")
@@ -59,7 +90,7 @@ class DatabaseCommands(object):
                 path += "&metadata-only=True"
 
             # If it is too big, we drop to POST (note that means that we can't use the HTTP cache any longer)
-            if (sum(len(x) for x in key_or_keys)) > 1024:
+            if allow_post and (sum(len(x) for x in key_or_keys)) > 1024:
                 method = "POST"
                 data = list(key_or_keys)
             else:
@@ -67,12 +98,7 @@ class DatabaseCommands(object):
 
         else:
             path += "&id={0}".format(Utils.quote_key(key_or_keys))
-
-        response = self._requests_handler.http_request_handler(path, method, data=data,
-                                                               force_read_from_master=force_read_from_master)
-        if response.status_code == 200:
-            response = response.json()
-        return response
+        return path, method, data
 
     def delete(self, key, etag=None):
         if key is None:
@@ -121,14 +147,23 @@ class DatabaseCommands(object):
             raise exceptions.ErrorResponseException(response["Error"][:85])
         return response
 
-    def batch(self, commands_array):
+    def batch(self, commands_array, primary_only=False):
+        """
+        @param commands_array: the commands to execute in a single transaction
+        :type list
+        @param primary_only: True to write only to the primary (no failover to the secondaries)
+        :type bool
+        """
         data = []
         for command in commands_array:
             if not hasattr(command, 'command'):
                 raise ValueError("Not a valid command")
             data.append(command.to_json())
-        response = self._requests_handler.http_request_handler("bulk_docs", "POST", data=data).json()
+        response = self._requests_handler.http_request_handler("bulk_docs", "POST", data=data,
+                                                               primary_only=primary_only).json()
         if "Error" in response:
+            if "ActualEtag" in response:
+                raise exceptions.FetchConcurrencyException(response["Error"])
             raise ValueError(response["Error"])
         return response
 
@@ -257,13 +292,176 @@ class DatabaseCommands(object):
         @return:json
         :rtype:dict
         """
+        path = self.build_query_path(index_name, index_query, includes, metadata_only, index_entries_only)
+        return self.query_by_path(path, force_read_from_master)
+
+    def query_by_path(self, path, force_read_from_master=False, timings=None):
+        """
+        @param path: the path of the query, as build_query_path returns it (e.g. the path of a compiled query)
+        :type str
+        @param timings: the time (in seconds) the request took is added to its Network value
+        and the time its json took to parse to its Parse value
+        :type dict
+        @return:json
+        :rtype:dict
+        """
+        started = time.time()
+        response = self._requests_handler.http_request_handler(path, "GET",
+                                                               force_read_from_master=force_read_from_master)
+        received = time.time()
+        response = response.json()
+        if timings is not None:
+            timings["Network"] += received - started
+            timings["Parse"] += time.time() - received
+        if "Error" in response:
+            raise exceptions.ErrorResponseException(response["Error"][:100])
+        return response
+
+    def get_facets(self, index_name, index_query, facets=None, facet_setup_doc=None, start=0, page_size=None,
+                   force_read_from_master=False):
+        """
+        Count the results of a query by the terms or the ranges of fields (the server computes the counts)
+
+        @param index_name: A name of an index to query
+        :type str
+        @param index_query: The query whose results are counted
+        :type IndexQuery
+        @param facets: The facets to compute
+        :type list of Facet
+        @param facet_setup_doc: The key of a stored FacetSetup document (instead of facets)
+        :type str
+        @param start: The number of terms to skip in every facet
+        :type int
+        @param page_size: The number of terms of every facet (None for all of them)
+        :type int
+        @param force_read_from_master: If True the reading also will be from the master
+        :type bool
+        @return: the json result, the values of every facet by its name are in Results
+        :rtype: dict
+        """
+        if (facets is None) == (facet_setup_doc is None):
+            raise ValueError("Either facets or facet_setup_doc must be given")
+        path = self.build_query_path(index_name, index_query, endpoint="facets")
+        path += "&facetStart={0}".format(start)
+        if page_size is not None:
+            path += "&facetPageSize={0}".format(page_size)
+        if facet_setup_doc is not None:
+            path += "&facetDoc={0}".format(Utils.quote_key(facet_setup_doc))
+            response = self._requests_handler.http_request_handler(path, "GET",
+                                                                   force_read_from_master=force_read_from_master)
+        else:
+            response = self._requests_handler.http_request_handler(path, "POST",
+                                                                   data=[facet.to_json() for facet in facets],
+                                                                   force_read_from_master=force_read_from_master)
+        if response.status_code == 404:
+            raise exceptions.ErrorResponseException("There is no index or facet setup for the facets of {0}".format(
+                index_name))
+        response = response.json()
+        if "Error" in response:
+            raise exceptions.ErrorResponseException(response["Error"][:100])
+        return response
+
+    def put_facet_setup(self, facet_setup):
+        """
+        @param facet_setup: The facets to store (use its key as facet_setup_doc of get_facets)
+        :type FacetSetup
+        """
+        return self.put(facet_setup.key, facet_setup.to_json(), {"Raven-Entity-Name": "FacetSetups"})
+
+    def stream_query(self, index_name, index_query, force_read_from_master=False):
+        """
+        Get all the results of a query through the streaming endpoint of the server, without paging
+
+        @param index_name: A name of an index to query
+        :type str
+        @param index_query: A query definition (the page size limits the results only when it was set)
+        :type IndexQuery
+        @param force_read_from_master: If True the reading also will be from the master
+        :type bool
+        @return: the results (documents with their @metadata) parsed one at a time as they arrive
+        :rtype: generator
+        """
+        path = self.build_query_path(index_name, index_query, streaming=True)
+        return self._stream(path, force_read_from_master)
+
+    def stream_docs(self, from_etag=None, starts_with=None, matches=None, start=0, page_size=None, exclude=None,
+                    skip_after=None, force_read_from_master=False):
+        """
+        Get documents through the streaming endpoint of the server, in the order of their etags
+        (or of their keys when starts_with is used)
+
+        @param from_etag: stream the documents that were changed after this etag (the etag of the last
+        document a previous stream returned resumes that stream)
+        :type str
+        @param starts_with: stream the documents whose key starts with this prefix (cannot be used with from_etag)
+        :type str
+        @param matches: pipe separated wildcards the key (after the prefix) has to match e.g. "*/1|user*"
+        :type str
+        @param start: the number of documents to skip
+        :type int
+        @param page_size: the maximum number of documents to stream (None for all of them)
+        :type int
+        @param exclude: pipe separated wildcards of the keys to skip
+        :type str
+        @param skip_after: stream the documents whose key comes after this key (resumes a starts_with stream)
+        :type str
+        @param force_read_from_master: If True the reading also will be from the master
+        :type bool
+        @return: the documents (with their @metadata) parsed one at a time as they arrive
+        :rtype: generator
+        """
+        if from_etag is not None and starts_with is not None:
+            raise ValueError("from_etag and starts_with cannot be used together")
+        path = "streams/docs?"
+        if from_etag is not None:
+            path += "&etag={0}".format(from_etag)
+        else:
+            if starts_with is not None:
+                path += "&startsWith={0}".format(Utils.quote_key(starts_with))
+            if matches:
+                path += "&matches={0}".format(Utils.quote_key(matches))
+            if exclude:
+                path += "&exclude={0}".format(Utils.quote_key(exclude))
+            if skip_after is not None:
+                path += "&skipAfter={0}".format(Utils.quote_key(skip_after))
+        if start:
+            path += "&start={0}".format(start)
+        if page_size is not None:
+            path += "&pageSize={0}".format(page_size)
+        return self._stream(path, force_read_from_master)
+
+    def _stream(self, path, force_read_from_master):
+        response = self._requests_handler.http_request_handler(path, "GET", stream=True,
+                                                               force_read_from_master=force_read_from_master)
+        if response.status_code != 200:
+            try:
+                error = response.json().get("Error", None)
+            except ValueError:
+                error = None
+            finally:
+                response.close()
+            raise exceptions.ErrorResponseException(
+                (error or "Stream failed with status {0}".format(response.status_code))[:100])
+        return json_stream.iterate_results(response)
+
+    @staticmethod
+    def build_query_path(index_name, index_query, includes=None, metadata_only=False, index_entries_only=False,
+                         streaming=False, endpoint="indexes"):
+        """
+        @param streaming: True for the path of the streaming endpoint (that is not paged)
+        :type bool
+        @param endpoint: the endpoint that runs the query, e.g. facets
+        :type str
+        @return: the path (relative to the database) of the GET request that runs the query
+        :rtype: str
+        """
         if not index_name:
             raise ValueError("index_name cannot be None or empty")
         if index_query is None:
             raise ValueError("None query is invalid")
         if not isinstance(index_query, IndexQuery):
             raise ValueError("query must be IndexQuery type")
-        path = "indexes/{0}?".format(Utils.quote_key(index_name))
+        path = "{0}/{1}?".format("streams/query" if streaming else endpoint, Utils.quote_key(index_name))
         if index_query.default_operator is QueryOperator.AND:
             path += "&operator={0}".format(index_query.default_operator.value)
         if index_query.query:
@@ -285,13 +483,50 @@ class DatabaseCommands(object):
             path += "".join("&include=" + item for item in includes)
         if index_query.start:
             path += "&start={0}".format(index_query.start)
+        if index_query.cutoff is not None:
+            path += "&cutOff={0}".format(Utils.quote_key(Utils.datetime_to_string(index_query.cutoff) + "Z"))
+        if index_query.cutoff_etag is not None:
+            path += "&cutOffEtag={0}".format(index_query.cutoff_etag)
+        if index_query.show_timings:
+            path += "&showTimings=true"
+        if index_query.wait_for_non_stale_results_timeout is not None:
+            path += "&waitForNonStaleResultsTimeout={0}".format(
+                Utils.quote_key(Utils.timedelta_to_str(index_query.wait_for_non_stale_results_timeout)))
 
-        path += "&pageSize={0}".format(index_query.page_size)
-        response = self._requests_handler.http_request_handler(path, "GET",
-                                                               force_read_from_master=force_read_from_master).json()
-        if "Error" in response:
-            raise exceptions.ErrorResponseException(response["Error"][:100])
-        return response
+        if not streaming or index_query.page_size_set:
+            path += "&pageSize={0}".format(index_query.page_size)
+        return path
+
+    def multi_get(self, paths, force_read_from_master=False):
+        """
+        Execute several GET requests in a single round trip
+
+        @param paths: the path (relative to the database) of every request, e.g. "queries/?&id=users%2F1"
+        :type list
+        @param force_read_from_master: If True the reading also will be from the master
+        :type bool
+        @return: the json result of every request (None for a request that found nothing)
+        :rtype: list
+        """
+        data = []
+        for path in paths:
+            url, __, query = path.partition("?")
+            data.append({"Url": "/" + url, "Query": "?" + query if query else "", "Headers": {}})
+        response = self._requests_handler.http_request_handler("multi_get", "POST", data=data,
+                                                               force_read_from_master=force_read_from_master)
+        if response.status_code != 200:
+            raise exceptions.ErrorResponseException("multi_get failed with status {0}".format(response.status_code))
+        results = []
+        for item in response.json():
+            if item is None or item["Status"] == 404:
+                results.append(None)
+            elif item["Status"] >= 400:
+                result = item.get("Result", None) or {}
+                raise exceptions.ErrorResponseException(
+                    result.get("Error", "Request failed with status {0}".format(item["Status"]))[:100])
+            else:
+                results.append(item["Result"])
+        return results
 
     # For Admin use only (create or delete databases)
     class Admin(object):
@@ -53,17 +53,58 @@ class Failover(Enum):
     read_from_all_servers = 1024
 
 
+class SnapshotMode(Enum):
+    """
+    How a session keeps the original value of the documents it loads (to find the entities that changed).
+    """
+    # A copy of the document
+    copy = 0
+    # The document serialized to compact json bytes, a fraction of the size of the copy
+    serialized = 1
+    # Only a hash of the serialized document, the original value itself is not kept
+    hashed = 2
+
+
 inflector = Inflector()
 
 
 class DocumentConvention(object):
+    # The inflector is much slower than generating an id, so the collection name of each type is computed once
+    _type_tag_names = {}
+
     def __init__(self):
         self.max_number_of_request_per_session = 30
         self.max_ids_to_catch = 32
+        # hilo ranges grow from max_ids_to_catch up to this size when ids are consumed quickly
+        self.max_hilo_capacity = 1024
+        # the next hilo range is reserved in the background once this fraction of the current range is left
+        # (None to reserve it only when the current range is exhausted)
+        self.hilo_prefetch_low_water_mark = 0.25
         # timeout for wait to server in seconds
         self.timeout = 30
         self.failover_behavior = Failover.allow_reads_from_secondaries
         self.default_use_optimistic_concurrency = True
+        # how the session keeps the original value of the loaded documents (see SnapshotMode)
+        self.snapshot_mode = SnapshotMode.serialized
+        # send only the changed fields of a loaded document as a patch instead of the whole document
+        # (needs SnapshotMode.copy or SnapshotMode.serialized, or entities that derive from TrackedEntity)
+        self.use_patches_for_changes = False
+        # save_changes(transactional=False) splits the changes to batches of this many commands (None for one batch)
+        # and sends up to save_changes_parallelism of them at the same time
+        self.save_changes_batch_size = 1024
+        self.save_changes_parallelism = 4
+        # the gets of documents that threads make within this window (in seconds) are merged into one request
+        # (None to send every get on its own)
+        self.load_batching_window = None
+        # the number of results every request gets when a query is iterated page by page
+        self.query_page_size = 128
+        # the number of entities a session tracks before it evicts the least recently used unchanged ones
+        # (None for no limit)
+        self.max_tracked_entities = None
+        # queries that take longer (in seconds, from building them to converting their results) are logged
+        # with the timings of the client and of the server as warnings of pyravendb.store.session_query
+        # (None to not log them)
+        self.slow_query_threshold = None
         self.json_default_method = DocumentConvention.json_default
         self._system_database = "system"
 
@@ -84,10 +125,15 @@ class DocumentConvention(object):
 
     @staticmethod
     def default_transform_type_tag_name(name):
-        count = sum(1 for c in name if c.isupper())
-        if count <= 1:
-            return DocumentConvention.default_transform_plural(name.lower())
-        return DocumentConvention.default_transform_plural(name)
+        type_tag_name = DocumentConvention._type_tag_names.get(name, None)
+        if type_tag_name is None:
+            count = sum(1 for c in name if c.isupper())
+            if count <= 1:
+                type_tag_name = DocumentConvention.default_transform_plural(name.lower())
+            else:
+                type_tag_name = DocumentConvention.default_transform_plural(name)
+            DocumentConvention._type_tag_names[name] = type_tag_name
+        return type_tag_name
 
     @staticmethod
     def build_default_metadata(entity):
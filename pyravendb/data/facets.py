@@ -0,0 +1,112 @@
+from enum import Enum
+import numbers
+
+
+class FacetMode(Enum):
+    # A count for every term of the field
+    default = "Default"
+    # A count for every range of the field
+    ranges = "Ranges"
+
+    def __str__(self):
+        return self.value
+
+
+class FacetAggregation(Enum):
+    none = "None"
+    count = "Count"
+    max = "Max"
+    min = "Min"
+    average = "Average"
+    sum = "Sum"
+
+    def __str__(self):
+        return self.value
+
+
+class FacetTermSortMode(Enum):
+    value_asc = "ValueAsc"
+    value_desc = "ValueDesc"
+    hits_asc = "HitsAsc"
+    hits_desc = "HitsDesc"
+
+    def __str__(self):
+        return self.value
+
+
+class Facet(object):
+    def __init__(self, name, ranges=None, display_name=None, **kwargs):
+        """
+        @param name: The field in the index to count the results by (a numeric field with ranges is the _Range one,
+        e.g. price_Range)
+        :type str
+        @param ranges: The ranges to count the results in (None for a count of every term),
+        use Facet.range to build them
+        :type list
+        @param display_name: The name of the facet in the results (None for the name of the field)
+        :type str
+        @param kwargs: Can be use to initialize the other options of the facet: max_results, term_sort_mode,
+        include_remaining_terms, aggregation (a FacetAggregation or a list of them), aggregation_field
+        and aggregation_type
+        :type kwargs
+        """
+        self.name = name
+        self.ranges = ranges or []
+        self.display_name = display_name
+        self.max_results = kwargs.get("max_results", None)
+        self.term_sort_mode = kwargs.get("term_sort_mode", FacetTermSortMode.value_asc)
+        self.include_remaining_terms = kwargs.get("include_remaining_terms", False)
+        self.aggregation = kwargs.get("aggregation", FacetAggregation.none)
+        self.aggregation_field = kwargs.get("aggregation_field", None)
+        self.aggregation_type = kwargs.get("aggregation_type", None)
+
+    @property
+    def mode(self):
+        return FacetMode.ranges if self.ranges else FacetMode.default
+
+    @staticmethod
+    def range(low=None, high=None):
+        """
+        @param low: The lowest value of the range (None for no lower bound)
+        @param high: The highest value of the range (None for no upper bound)
+        @return: The range in the syntax of the index, e.g. [Dx0 TO Dx100]
+        (every number is a double, whatever its python type is)
+        :rtype: str
+        """
+        return "[{0} TO {1}]".format(Facet._range_value(low), Facet._range_value(high))
+
+    @staticmethod
+    def _range_value(value):
+        if value is None:
+            return "NULL"
+        if isinstance(value, bool):
+            return str(value).lower()
+        if isinstance(value, numbers.Real):
+            return "Dx{0}".format(value)
+        return str(value)
+
+    def to_json(self):
+        aggregation = self.aggregation
+        if isinstance(aggregation, (list, tuple)):
+            aggregation = ", ".join(str(item) for item in aggregation)
+        return {"Mode": str(self.mode), "Aggregation": str(aggregation), "AggregationField": self.aggregation_field,
+                "AggregationType": self.aggregation_type, "Name": self.name, "DisplayName": self.display_name,
+                "Ranges": self.ranges, "MaxResults": self.max_results, "TermSortMode": str(self.term_sort_mode),
+                "IncludeRemainingTerms": self.include_remaining_terms}
+
+
+class FacetSetup(object):
+    def __init__(self, key, facets):
+        """
+        A document of facets, stored once and used by its key (instead of sending the facets with every query)
+
+        @param key: The key of the document, e.g. facets/products
+        :type str
+        @param facets: The facets of the setup
+        :type list
+        """
+        self.key = key
+        self.facets = facets
+
+    def to_json(self):
+        return {"Facets": [facet.to_json() for facet in self.facets]}
@@ -121,6 +121,17 @@ class IndexQuery(object):
         :type int
         @param fetch : fetch only the terms you want from the index
         :type list
+        @param cutoff: the results are not stale when the index is up to date with the documents that were changed
+        before this time (in UTC), not with the changes made since
+        :type datetime
+        @param cutoff_etag: the results are not stale when the index is up to date with this etag
+        :type str
+        @param wait_for_non_stale_results_timeout: the time the server may wait for the index before it returns
+        stale results
+        :type timedelta
+        @param show_timings: True to get the time every stage of the query took on the server
+        (TimingsInMilliseconds of the result)
+        :type bool
         """
         self.query = query
         self.__page_size_set = False
@@ -132,6 +143,10 @@ class IndexQuery(object):
         self.sort_fields = kwargs.get("sort_fields", {})
         self.fetch = kwargs.get("fetch", [])
         self.wait_for_non_stale_results = kwargs.get("wait_for_non_stale_results", False)
+        self.cutoff = kwargs.get("cutoff", None)
+        self.cutoff_etag = kwargs.get("cutoff_etag", None)
+        self.wait_for_non_stale_results_timeout = kwargs.get("wait_for_non_stale_results_timeout", None)
+        self.show_timings = kwargs.get("show_timings", False)
         self.start = start
 
     @property
@@ -142,3 +157,7 @@ class IndexQuery(object):
     def page_size(self, value):
         self._page_size = value
         self.__page_size_set = True
+
+    @property
+    def page_size_set(self):
+        return self.__page_size_set
@@ -1,21 +1,106 @@
 from pyravendb.custom_exceptions import exceptions
-from threading import Lock
+from pyravendb.d_commands import commands_data
+from pyravendb.tools.utils import Utils
+from threading import Lock, Thread
+import itertools
+import logging
+import time
+
+_log = logging.getLogger(__name__)
 
 
 class Range(object):
     def __init__(self, min_id=1, max_id=0):
         self.min_id = min_id
         self.max_id = max_id
-        self.current = self.min_id - 1
+        # next() on itertools.count is atomic under the GIL, so handing out ids needs no lock
+        self._counter = itertools.count(min_id)
+
+    def next_id(self):
+        """
+        @return: the next id of the range or None if the range is exhausted
+        :rtype: int
+        """
+        current_id = next(self._counter)
+        # max_id must be read after taking the id, take_block lowers it before it looks at the counter
+        if current_id > self.max_id:
+            return None
+        return current_id
+
+    def take_block(self, count):
+        """
+        Cut a contiguous block of ids from the top of the range (must be called under the collection lock)
+
+        @param count: the number of ids in the block
+        :type int
+        @return: the first id of the block or None if the range does not have enough ids left
+        :rtype: int
+        """
+        max_id = self.max_id
+        self.max_id = max_id - count
+        if next(self._counter) > self.max_id + 1:
+            # ids from the block were already handed out, give the top of the range back
+            self.max_id = max_id
+            return None
+        return self.max_id + 1
+
+
+class _CollectionState(object):
+    def __init__(self, type_tag_name, capacity):
+        self.type_tag_name = type_tag_name
+        self.range = Range()
+        self.next_range = None
+        self.prefetch_thread = None
+        self.capacity = capacity
+        self.last_range_request = None
+        self.lock = Lock()
 
 
 class HiloGenerator(object):
-    def __init__(self, capacity, database_commands):
+    # A range that was used up faster than this (in seconds) doubles the size of the next one
+    grow_threshold = 5
+    # A collection that asks for a new range after being idle longer than this (in seconds) halves it
+    shrink_threshold = 60
+
+    def __init__(self, capacity, database_commands, max_capacity=None, prefetch_low_water_mark=None):
+        """
+        @param capacity: the base (and minimal) number of ids we request from the server in a single range
+        :type int
+        @param database_commands: the commands we use to read the hilo documents
+        :type DatabaseCommands
+        @param max_capacity: the upper bound for the size of a single range (None for fixed size ranges)
+        :type int
+        @param prefetch_low_water_mark: the fraction of the range that is left when we start reserving the next range
+        in the background (None to fetch only when the range is exhausted)
+        :type float
+        """
         self.capacity = capacity
-        self.collection_ranges = {}
+        self.max_capacity = capacity if max_capacity is None else max(capacity, max_capacity)
+        self.prefetch_low_water_mark = prefetch_low_water_mark
+        # The lock only guards adding collections, every collection refills its range under its own lock
+        self._collections = {}
         self.lock = Lock()
         self.database_commands = database_commands
 
+    def reset(self):
+        """
+        Forget all the ranges, the next id of every collection will come from a new range
+        """
+        self.lock = Lock()
+        self._collections = {}
+
+    def _get_collection(self, type_tag_name):
+        collection = self._collections.get(type_tag_name, None)
+        if collection is None:
+            with self.lock:
+                collection = self._collections.get(type_tag_name, None)
+                if collection is None:
+                    collection = _CollectionState(type_tag_name, self.capacity)
+                    collections = {type_tag_name: collection}
+                    collections.update(self._collections)
+                    self._collections = collections
+        return collection
+
     def generate_document_id(self, entity, convention, request_handler):
         """
         @param entity: the object we want to generate id for
@@ -28,55 +113,170 @@ class HiloGenerator(object):
         :rtype: int
         """
         type_tag_name = convention.default_transform_type_tag_name(entity.__class__.__name__)
-        if type_tag_name in self.collection_ranges:
-            self.next_id(type_tag_name, request_handler)
-        else:
-            with self.lock:
-                if type_tag_name in self.collection_ranges:
-                    self.next_id(type_tag_name, request_handler)
-                    return "{0}/{1}".format(type_tag_name, self.collection_ranges[type_tag_name].current)
-                ranges = {type_tag_name: Range()}
-                ranges.update(self.collection_ranges)
-                self.collection_ranges = ranges
-            self.next_id(type_tag_name, request_handler)
-        return "{0}/{1}".format(type_tag_name, self.collection_ranges[type_tag_name].current)
+        return "{0}/{1}".format(type_tag_name, self.next_id(type_tag_name, request_handler))
+
+    def generate_document_ids(self, counts, request_handler):
+        """
+        Reserve a contiguous block of ids for each of the collections.
+        All the collections that need a new range are refilled together in a single round trip
+
+        @param counts: the number of ids we want for each collection (type tag name)
+        :type dict
+        @param request_handler: the handler for the requests
+        :type HttpRequestsFactory
+        @return: the ids we reserved for each collection
+        :rtype: dict
+        """
+        ids = {type_tag_name: [] for type_tag_name in counts if counts[type_tag_name] < 1}
+        type_tag_names = sorted(type_tag_name for type_tag_name in counts if counts[type_tag_name] > 0)
+        collections = [self._get_collection(type_tag_name) for type_tag_name in type_tag_names]
+        # Always lock in the same order so two bulk reservations cannot deadlock each other
+        for collection in collections:
+            collection.lock.acquire()
+        try:
+            capacities = {}
+            for type_tag_name, collection in zip(type_tag_names, collections):
+                count = counts[type_tag_name]
+                self._join_prefetch(collection)
+                first_id = collection.range.take_block(count)
+                if first_id is None and collection.next_range is not None:
+                    # next_id does not take the lock, the block is cut before the range is published
+                    next_range = collection.next_range
+                    first_id = next_range.take_block(count)
+                    collection.range = next_range
+                    collection.next_range = None
+                if first_id is None:
+                    capacities[type_tag_name] = max(count, self._modify_capacity(collection))
+                    continue
+                ids[type_tag_name] = ["{0}/{1}".format(type_tag_name, i) for i in range(first_id, first_id + count)]
+
+            while capacities:
+                ranges = self.get_next_ranges(capacities)
+                capacities = {}
+                for type_tag_name, collection in zip(type_tag_names, collections):
+                    if type_tag_name not in ranges:
+                        continue
+                    count = counts[type_tag_name]
+                    first_id = ranges[type_tag_name].take_block(count)
+                    collection.range = ranges[type_tag_name]
+                    if first_id is None:
+                        # Should not happen with a range of at least count ids, but never hand out a broken block
+                        capacities[type_tag_name] = max(count, self._modify_capacity(collection))
+                        continue
+                    ids[type_tag_name] = ["{0}/{1}".format(type_tag_name, i) for i in range(first_id, first_id + count)]
+        finally:
+            for collection in collections:
+                collection.lock.release()
+        return ids
 
     def next_id(self, type_tag_name, request_handler):
+        collection = self._get_collection(type_tag_name)
         while True:
-            my_collection_range = self.collection_ranges[type_tag_name]
-            current_max = my_collection_range.max_id
-            with self.lock:
-                my_collection_range.current += 1
-                current_id = my_collection_range.current
-            if current_id <= current_max:
-                return
-            with self.lock:
-                if my_collection_range != self.collection_ranges[type_tag_name]:
+            collection_range = collection.range
+            current_id = collection_range.next_id()
+            if current_id is not None:
+                if self.prefetch_low_water_mark is not None:
+                    self._prefetch_if_needed(collection, collection_range, current_id)
+                return current_id
+            with collection.lock:
+                if collection_range is not collection.range:
+                    continue
+                self._join_prefetch(collection)
+                if collection.next_range is not None:
+                    collection.range = collection.next_range
+                    collection.next_range = None
                     continue
                 try:
-                    self.collection_ranges[type_tag_name] = self.get_next_range(type_tag_name, request_handler)
+                    collection.range = self._get_next_range(collection)
                 except exceptions.FetchConcurrencyException:
                     pass
 
-    def get_next_range(self, type_tag_name, request_handler):
-        while True:
-            path = "Raven/Hilo/{0}&id=Raven/ServerPrefixForHilo".format(type_tag_name)
-            document = None
-            try:
-                document = self.database_commands.get(path)["Results"][0]
-            except (exceptions.ErrorResponseException, IndexError):
-                pass
-            etag = ""
-            min_id = 1
-            if document is None:
-                max_id = self.capacity
-            else:
-                min_id = document["Max"] + 1
-                max_id = document["Max"] + self.capacity
-                etag = document["@metadata"]["@etag"]
+    def _prefetch_if_needed(self, collection, collection_range, current_id):
+        range_size = collection_range.max_id - collection_range.min_id + 1
+        if collection_range.max_id - current_id > range_size * self.prefetch_low_water_mark:
+            return
+        if collection.prefetch_thread is not None or collection.next_range is not None:
+            return
+        with collection.lock:
+            if collection.prefetch_thread is not None or collection.next_range is not None \
+                    or collection_range is not collection.range:
+                return
+            # The capacity is modified under the lock, the thread only asks for the range
+            collection.prefetch_thread = Thread(target=self._prefetch_range,
+                                                args=(collection, self._modify_capacity(collection)))
+            collection.prefetch_thread.daemon = True
+            collection.prefetch_thread.start()
+
+    def _prefetch_range(self, collection, capacity):
+        # The thread that exhausts the range will fetch the next one itself if this fails
+        type_tag_name = collection.type_tag_name
+        try:
+            collection.next_range = self.get_next_ranges({type_tag_name: capacity})[type_tag_name]
+        except Exception:
+            _log.warning("Failed to prefetch the next hilo range of %s", type_tag_name, exc_info=True)
 
+    @staticmethod
+    def _join_prefetch(collection):
+        # Must be called under the collection lock
+        if collection.prefetch_thread is not None:
+            collection.prefetch_thread.join()
+            collection.prefetch_thread = None
+
+    def _modify_capacity(self, collection):
+        """
+        Adapt the range size of the collection to the rate its ids are consumed
+
+        @param collection: the collection we are about to request a new range for
+        :type _CollectionState
+        @return: the number of ids to request
+        :rtype: int
+        """
+        now = time.time()
+        if collection.last_range_request is not None:
+            span = now - collection.last_range_request
+            if span < HiloGenerator.grow_threshold:
+                collection.capacity = min(collection.capacity * 2, self.max_capacity)
+            elif span > HiloGenerator.shrink_threshold:
+                collection.capacity = max(collection.capacity // 2, self.capacity)
+        collection.last_range_request = now
+        return collection.capacity
+
+    def get_next_ranges(self, capacities):
+        """
+        Get new ranges for several collections with a single multi document get and a single batch
+
+        @param capacities: the size of the range we want for each collection (type tag name)
+        :type dict
+        @return: the new range of each collection
+        :rtype: dict
+        """
+        type_tag_names = list(capacities)
+        keys = ["Raven/Hilo/{0}".format(type_tag_name) for type_tag_name in type_tag_names]
+        while True:
+            # A range reserved on a secondary could be handed out again by the primary, so the hilo documents
+            # are read and written only on the primary
+            documents = self.database_commands.get(keys, primary_only=True)["Results"]
+            ranges = {}
+            commands = []
+            for type_tag_name, key, document in zip(type_tag_names, keys, documents):
+                if document is None:
+                    min_id = 1
+                    etag = Utils.empty_etag()
+                else:
+                    min_id = document["Max"] + 1
+                    etag = document["@metadata"]["@etag"]
+                max_id = min_id + capacities[type_tag_name] - 1
+                ranges[type_tag_name] = Range(min_id, max_id)
+                commands.append(commands_data.PutCommandData(key, etag, {"Max": max_id}, {}))
             try:
-                request_handler.call_hilo(type_tag_name, max_id, etag)
-                return Range(min_id, max_id)
+                self.database_commands.batch(commands, primary_only=True)
+                return ranges
             except exceptions.FetchConcurrencyException:
                 pass
+
+    def _get_next_range(self, collection):
+        type_tag_name = collection.type_tag_name
+        return self.get_next_ranges({type_tag_name: self._modify_capacity(collection)})[type_tag_name]
+
+    def get_next_range(self, type_tag_name, request_handler):
+        return self._get_next_range(self._get_collection(type_tag_name))
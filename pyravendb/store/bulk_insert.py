@@ -0,0 +1,205 @@
+from pyravendb.custom_exceptions import exceptions
+from pyravendb.data.operations import Operations
+from pyravendb.tools.generate_id import GenerateEntityIdOnTheClient
+from pyravendb.tools import bson_writer
+from threading import Thread
+import struct
+import time
+import uuid
+import zlib
+
+try:
+    import Queue as queue  # < 3.0
+except ImportError:
+    import queue as queue
+
+# Marks the end of the documents in the queue
+_done = object()
+_min_batch_size = 32
+
+
+class BulkInsertOperation(object):
+    """
+    Insert a large number of documents through the bulk insert endpoint of the server.
+
+    The documents are serialized on a background thread and sent in one chunked request, as gzipped BSON batches.
+    The size of the batches follows the time the server takes to receive them: it grows while a batch is sent
+    in less than half of batch_latency and shrinks when a batch takes longer than batch_latency
+    """
+
+    def __init__(self, document_store, check_for_updates=False, skip_overwriting=False, batch_size=512,
+                 max_batch_size=8192, batch_latency=0.5, max_pending_documents=16384):
+        """
+        @param document_store: the store we insert the documents to
+        :type documentstore
+        @param check_for_updates: True if documents that already exist may be overwritten
+        (the server checks every key, which is slower)
+        :type bool
+        @param skip_overwriting: True to skip the documents that already exist instead of failing
+        :type bool
+        @param batch_size: the number of documents in the first batch
+        :type int
+        @param max_batch_size: the maximum number of documents in a batch
+        :type int
+        @param batch_latency: the time (in seconds) it should take to send a batch
+        :type float
+        @param max_pending_documents: the number of documents store waits for the background thread
+        to serialize before it blocks
+        :type int
+        """
+        self._document_store = document_store
+        self._requests_handler = document_store._requests_handler
+        self._conventions = document_store.conventions
+        self._batch_size = batch_size
+        self._max_batch_size = max_batch_size
+        self._batch_latency = batch_latency
+        self._queue = queue.Queue(maxsize=max_pending_documents)
+        self._path = "bulkInsert?checkForUpdates={0}&checkReferencesInIndexes=false&operationId={1}" \
+                     "&skipOverwriting={2}".format(str(check_for_updates).lower(), uuid.uuid4(),
+                                                   str(skip_overwriting).lower())
+        self._error = None
+        self._closed = False
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.close()
+        except Exception:
+            # Do not hide the exception that ended the with block
+            if exc_type is None:
+                raise
+
+    def store(self, entity, key=None, metadata=None):
+        """
+        @param entity: the entity or the document (a dict) to insert
+        :type object or dict
+        @param key: the key of the document (None to generate it with hilo, a dict without a key needs
+        a Raven-Entity-Name in its metadata)
+        :type str
+        @param metadata: metadata to add to the document
+        :type dict
+        @return: the key of the document
+        :rtype: str
+        """
+        if entity is None:
+            raise ValueError("None entity value is invalid")
+        if self._closed:
+            raise exceptions.InvalidOperationException("Cannot store documents after the bulk insert was closed")
+        self._raise_error()
+
+        if isinstance(entity, dict):
+            document = dict(entity)
+            document_metadata = dict(metadata) if metadata else {}
+            if key is None:
+                type_tag_name = document_metadata.get("Raven-Entity-Name", None)
+                if type_tag_name is None:
+                    raise ValueError("A document without a key needs a Raven-Entity-Name to generate its key")
+                key = "{0}/{1}".format(type_tag_name, self._document_store.generator.next_id(
+                    type_tag_name, self._requests_handler))
+        else:
+            if key is None:
+                key = GenerateEntityIdOnTheClient.try_get_id_from_instance(entity)
+            if not key:
+                key = self._document_store.generate_id(entity)
+            GenerateEntityIdOnTheClient.try_set_id_on_entity(entity, key)
+            # A copy, the entity can be changed while the document waits for the background thread
+            document = entity.__dict__.copy()
+            document.pop("Id", None)
+            document_metadata = self._conventions.build_default_metadata(entity)
+            if metadata:
+                document_metadata.update(metadata)
+
+        self._put((key, document, document_metadata))
+        return key
+
+    def close(self):
+        """
+        Send the documents that are left and wait for the server to finish inserting all of them
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._put(_done)
+        self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _put(self, item):
+        while True:
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                # The background thread stops reading the queue when the request fails
+                self._raise_error()
+
+    def _run(self):
+        try:
+            response = self._requests_handler.http_request_handler(self._path, "POST", data=self._batches(),
+                                                                   raw_data=True)
+            try:
+                result = response.json()
+            except ValueError:
+                result = {}
+            if response.status_code not in (200, 202):
+                raise exceptions.ErrorResponseException(
+                    (result.get("Error", None) or "Bulk insert failed with status {0}".format(
+                        response.status_code))[:100])
+            operation_id = result.get("OperationId", None)
+            if operation_id is not None:
+                Operations(self._requests_handler).wait_for_operation_complete(operation_id)
+        except Exception as e:
+            self._error = e
+
+    def _batches(self):
+        batch_size = self._batch_size
+        finished = False
+        while not finished:
+            batch = []
+            item = self._queue.get()
+            while item is not _done:
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    break
+                try:
+                    # A partial batch is sent when the documents stop coming
+                    item = self._queue.get(timeout=self._batch_latency)
+                except queue.Empty:
+                    break
+            else:
+                finished = True
+            if batch:
+                chunk = self._write_batch(batch)
+                start = time.time()
+                yield chunk
+                batch_size = self._next_batch_size(batch_size, len(batch), time.time() - start)
+
+    def _next_batch_size(self, batch_size, count, elapsed):
+        if elapsed > self._batch_latency:
+            return max(batch_size // 2, _min_batch_size)
+        if count == batch_size and elapsed < self._batch_latency / 2:
+            return min(batch_size * 2, self._max_batch_size)
+        return batch_size
+
+    def _write_batch(self, batch):
+        """
+        @return: the length of the gzipped batch followed by the batch (the number of documents and their BSON)
+        :rtype: bytes
+        """
+        documents = [struct.pack("<i", len(batch))]
+        for key, document, metadata in batch:
+            metadata = dict(metadata)
+            metadata["@id"] = key
+            document["@metadata"] = metadata
+            documents.append(bson_writer.dumps(document, self._conventions.json_default_method))
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compressed = compressor.compress(b"".join(documents)) + compressor.flush()
+        return struct.pack("<i", len(compressed)) + compressed
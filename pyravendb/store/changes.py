@@ -0,0 +1,267 @@
+from pyravendb.custom_exceptions import exceptions
+from pyravendb.tools.utils import Utils
+from threading import Thread, Lock, Event
+import logging
+import json
+import uuid
+
+_log = logging.getLogger(__name__)
+
+
+class Subscription(object):
+    def __init__(self, observable, on_next, on_error=None):
+        self._observable = observable
+        self.on_next = on_next
+        self.on_error = on_error
+
+    def close(self):
+        """
+        Stop receiving the notifications
+        """
+        self._observable._unsubscribe(self)
+
+
+class Observable(object):
+    """
+    The notifications of one thing the changes client watches (a document, a prefix, a collection, an index...)
+    """
+
+    def __init__(self, changes, command, value, notification_type, predicate):
+        self._changes = changes
+        self.command = command
+        self.value = value
+        self.notification_type = notification_type
+        self._predicate = predicate
+        self._subscriptions = []
+
+    def subscribe(self, on_next, on_error=None):
+        """
+        @param on_next: called (on the thread of the changes client) with the value of every notification
+        :type function
+        @param on_error: called with the error when the changes client gives up reconnecting
+        (no notification comes after it)
+        :type function
+        @return: the subscription, close it to stop receiving the notifications
+        :rtype: Subscription
+        """
+        subscription = Subscription(self, on_next, on_error)
+        with self._changes.lock:
+            self._subscriptions.append(subscription)
+            first = len(self._subscriptions) == 1
+        if first:
+            self._changes._watch(self)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._changes.lock:
+            if subscription not in self._subscriptions:
+                return
+            self._subscriptions.remove(subscription)
+            last = len(self._subscriptions) == 0
+        if last:
+            self._changes._unwatch(self)
+
+    def _send(self, notification_type, value):
+        if notification_type != self.notification_type or not self._predicate(value):
+            return
+        with self._changes.lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.on_next(value)
+            except Exception:
+                # A failing subscriber does not stop the notifications of the others
+                _log.exception("A subscriber of %s %s failed to handle a notification", self.command, self.value)
+
+    def _fail(self, error):
+        with self._changes.lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if subscription.on_error is None:
+                continue
+            try:
+                subscription.on_error(error)
+            except Exception:
+                _log.exception("A subscriber of %s %s failed to handle an error", self.command, self.value)
+
+
+class DatabaseChanges(object):
+    """
+    A client of the changes endpoint of the server.
+    A background thread keeps a connection to changes/events, delivers the notifications to the subscribers
+    and reconnects (and watches everything again) when the connection is lost.
+    After max_reconnect_attempts failed reconnections in a row the client closes itself, the error is in error
+    and is passed to the on_error of the subscribers
+    """
+
+    def __init__(self, requests_handler, reconnect_delay=1, max_reconnect_delay=15, max_reconnect_attempts=10):
+        """
+        @param requests_handler: the handler for the requests of the database we watch
+        :type HttpRequestsFactory
+        @param reconnect_delay: the time (in seconds) we wait before the first reconnection,
+        it doubles with every failed one up to max_reconnect_delay
+        :type float
+        @param max_reconnect_attempts: the number of failed connections in a row before we give up
+        (None to never give up)
+        :type int
+        """
+        self._requests_handler = requests_handler
+        self._reconnect_delay = reconnect_delay
+        self._max_reconnect_delay = max_reconnect_delay
+        self._max_reconnect_attempts = max_reconnect_attempts
+        self.error = None
+        self._connection_id = str(uuid.uuid4())
+        self.lock = Lock()
+        self._observables = {}
+        self._watched = set()
+        self._response = None
+        self._closed = False
+        self._stopped = Event()
+        self.connected = Event()
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def for_document(self, key):
+        return self._observable("watch-doc", key, "DocumentChangeNotification",
+                                lambda value: value["Id"].lower() == key.lower())
+
+    def for_documents_start_with(self, prefix):
+        return self._observable("watch-prefix", prefix, "DocumentChangeNotification",
+                                lambda value: value["Id"].lower().startswith(prefix.lower()))
+
+    def for_documents_in_collection(self, collection_name):
+        return self._observable("watch-collection", collection_name, "DocumentChangeNotification",
+                                lambda value: (value.get("CollectionName", None) or "").lower() ==
+                                collection_name.lower())
+
+    def for_all_documents(self):
+        return self._observable("watch-docs", None, "DocumentChangeNotification", lambda value: True)
+
+    def for_index(self, index_name):
+        return self._observable("watch-index", index_name, "IndexChangeNotification",
+                                lambda value: value["Name"].lower() == index_name.lower())
+
+    def for_all_indexes(self):
+        return self._observable("watch-indexes", None, "IndexChangeNotification", lambda value: True)
+
+    def for_bulk_insert(self, operation_id=None):
+        """
+        @param operation_id: the id of the bulk insert operation (None for all of them)
+        :type str
+        """
+        return self._observable("watch-bulk-operation", operation_id, "BulkInsertChangeNotification",
+                                lambda value: operation_id is None or str(value["OperationId"]) == str(operation_id))
+
+    def close(self):
+        self._closed = True
+        self._stopped.set()
+        response = self._response
+        if response is not None:
+            # Ends the read of the background thread
+            response.close()
+
+    def _observable(self, command, value, notification_type, predicate):
+        if self._closed:
+            if self.error is not None:
+                raise exceptions.InvalidOperationException(
+                    "The changes client gave up reconnecting: {0}".format(self.error))
+            raise exceptions.InvalidOperationException("The changes client was closed")
+        with self.lock:
+            observable = self._observables.get((command, value), None)
+            if observable is None:
+                observable = Observable(self, command, value, notification_type, predicate)
+                self._observables[(command, value)] = observable
+        return observable
+
+    def _watch(self, observable):
+        with self.lock:
+            self._watched.add(observable)
+        if self.connected.is_set():
+            self._send_command(observable.command, observable.value)
+
+    def _unwatch(self, observable):
+        with self.lock:
+            self._watched.discard(observable)
+        if self.connected.is_set():
+            self._send_command("un" + observable.command, observable.value)
+
+    def _send_command(self, command, value):
+        path = "changes/config?id={0}&command={1}".format(self._connection_id, command)
+        if value is not None:
+            path += "&value={0}".format(Utils.quote_key(str(value)))
+        try:
+            self._requests_handler.http_request_handler(path, "GET", force_read_from_master=True)
+        except Exception:
+            # The command is sent again when the connection is restored
+            _log.exception("Failed to send %s to the changes endpoint", command)
+
+    def _run(self):
+        delay = self._reconnect_delay
+        failed_attempts = 0
+        while not self._closed:
+            try:
+                self._response = self._requests_handler.http_request_handler(
+                    "changes/events?id={0}".format(self._connection_id), "GET", force_read_from_master=True,
+                    stream=True)
+                if self._response.status_code != 200:
+                    raise exceptions.ErrorResponseException(
+                        "Could not connect to the changes endpoint (status {0})".format(self._response.status_code))
+                self.connected.set()
+                delay = self._reconnect_delay
+                failed_attempts = 0
+                with self.lock:
+                    watched = list(self._watched)
+                for observable in watched:
+                    self._send_command(observable.command, observable.value)
+                self._read(self._response)
+            except Exception as e:
+                if not self._closed:
+                    failed_attempts += 1
+                    _log.warning("The connection to the changes endpoint failed (attempt %d)", failed_attempts,
+                                 exc_info=True)
+                    if self._max_reconnect_attempts is not None and failed_attempts >= self._max_reconnect_attempts:
+                        self._give_up(e)
+            finally:
+                self.connected.clear()
+                if self._response is not None:
+                    self._response.close()
+                    self._response = None
+            if not self._closed:
+                self._stopped.wait(delay)
+                delay = min(delay * 2, self._max_reconnect_delay)
+
+    def _give_up(self, error):
+        _log.error("Giving up on the changes endpoint after %d failed attempts: %s", self._max_reconnect_attempts,
+                   error)
+        self.error = error
+        self._closed = True
+        self._stopped.set()
+        with self.lock:
+            watched = list(self._watched)
+        for observable in watched:
+            observable._fail(error)
+
+    def _read(self, response):
+        for line in response.iter_lines(chunk_size=1024, decode_unicode=True):
+            if self._closed:
+                return
+            if isinstance(line, bytes):
+                line = line.decode("utf-8")
+            if not line.startswith("data:"):
+                continue
+            notification = json.loads(line[len("data:"):])
+            notification_type = notification.get("Type", None)
+            value = notification.get("Value", None)
+            if value is None or notification_type == "Heartbeat":
+                continue
+            with self.lock:
+                watched = list(self._watched)
+            for observable in watched:
+                observable._send(notification_type, value)
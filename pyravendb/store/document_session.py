@@ -1,15 +1,135 @@
 from pyravendb.tools.generate_id import GenerateEntityIdOnTheClient
 from pyravendb.custom_exceptions import exceptions
 from pyravendb.store.session_query import Query
+from pyravendb.store import tracked_entity
+from pyravendb.store import lazy
+from pyravendb.store import stream
 from pyravendb.d_commands import commands_data
+from pyravendb.data.patches import ScriptedPatchRequest
+from pyravendb.data.document_convention import SnapshotMode
 from pyravendb.tools.utils import Utils
+from multiprocessing.pool import ThreadPool
+import collections
+import hashlib
+import json
+import sys
+
+if sys.version_info.major > 2:
+    _intern = sys.intern
+else:
+    _intern = intern
+
+# Metadata values that repeat in every document of a collection
+_interned_metadata_values = {"Raven-Entity-Name", "Raven-Python-Type", "Raven-Clr-Type"}
 
 
 class _SaveChangesData(object):
-    def __init__(self, commands, deferred_command_count, entities=None):
+    def __init__(self, commands, deferred_command_count, entities=None, deleted_documents=None):
         self.commands = commands
         self.entities = [] if entities is None else entities
         self.deferred_command_count = deferred_command_count
+        # The records of the deleted entities, to put them back if the batch fails
+        self.deleted_documents = {} if deleted_documents is None else deleted_documents
+
+    def slice(self, start, end):
+        """
+        @return: the part of the data with the commands from start to end (and their entities)
+        :rtype: _SaveChangesData
+        """
+        deferred_command_count = max(0, min(end, self.deferred_command_count) - start)
+        entities = self.entities[max(0, start - self.deferred_command_count):max(0, end - self.deferred_command_count)]
+        deleted_documents = {entity: self.deleted_documents[entity] for entity in entities if
+                             entity is not None and entity in self.deleted_documents}
+        return _SaveChangesData(self.commands[start:end], deferred_command_count, entities, deleted_documents)
+
+
+class _DocumentInfo(object):
+    """
+    What the session knows about a document it tracks.
+    The original value is kept in the form the SnapshotMode of the conventions asks for
+    """
+    __slots__ = ["key", "etag", "metadata", "_original_metadata", "force_concurrency_check", "snapshot",
+                 "snapshot_mode"]
+
+    def __init__(self, key, etag, metadata, original_metadata, force_concurrency_check, snapshot, snapshot_mode):
+        self.key = key
+        self.etag = etag
+        self.metadata = metadata
+        self.snapshot_mode = snapshot_mode
+        self.original_metadata = original_metadata
+        self.force_concurrency_check = force_concurrency_check
+        self.snapshot = snapshot
+
+    def _serialize_metadata(self, metadata):
+        if self.snapshot_mode is SnapshotMode.copy:
+            return metadata.copy()
+        # The metadata is read back (e.g. Raven-Read-Only) so it is never hashed
+        return json.dumps(metadata, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+    @property
+    def original_metadata(self):
+        if self.snapshot_mode is SnapshotMode.copy:
+            return self._original_metadata
+        return _intern_metadata(json.loads(self._original_metadata.decode("utf-8")))
+
+    @original_metadata.setter
+    def original_metadata(self, original_metadata):
+        self._original_metadata = self._serialize_metadata(original_metadata)
+
+    def metadata_changed(self):
+        return self._original_metadata != self._serialize_metadata(self.metadata)
+
+    @property
+    def original_value(self):
+        if self.snapshot is None or self.snapshot_mode is SnapshotMode.hashed:
+            return None
+        if self.snapshot_mode is SnapshotMode.serialized:
+            return json.loads(self.snapshot.decode("utf-8"))
+        return self.snapshot
+
+    # The record used to be a dict, keep the item access working
+    def __getitem__(self, item):
+        return getattr(self, item)
+
+    def __setitem__(self, item, value):
+        if item == "original_value":
+            raise exceptions.InvalidOperationException("original_value is read only")
+        setattr(self, item, value)
+
+    def __contains__(self, item):
+        return item in ("key", "etag", "metadata", "original_metadata", "force_concurrency_check", "original_value")
+
+
+def _intern_metadata(metadata):
+    interned = {}
+    for key, value in metadata.items():
+        if isinstance(key, str):
+            key = _intern(key)
+            if key in _interned_metadata_values and isinstance(value, str):
+                value = _intern(value)
+        interned[key] = value
+    return interned
+
+
+def _sizeof(obj, seen):
+    """
+    The memory an object takes with everything it references, objects in seen are not counted again
+    """
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_sizeof(key, seen) + _sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_sizeof(item, seen) for item in obj)
+    else:
+        if hasattr(obj, "__dict__"):
+            size += _sizeof(obj.__dict__, seen)
+        for slot in getattr(type(obj), "__slots__", ()):
+            if slot not in ("__dict__", "__weakref__") and hasattr(obj, slot):
+                size += _sizeof(getattr(obj, slot), seen)
+    return size
 
 
 class documentsession(object):
@@ -22,7 +142,8 @@ class documentsession(object):
       :type DocumentStore
       """
 
-    def __init__(self, database, document_store, database_commands, session_id, force_read_from_master):
+    def __init__(self, database, document_store, database_commands, session_id, force_read_from_master,
+                 no_tracking=False):
         self.session_id = session_id
         self.database = database
         self.document_store = document_store
@@ -30,14 +151,22 @@ class documentsession(object):
         self._entities_by_key = {}
         self._includes = {}
         self._deleted_entities = set()
-        self._entities_and_metadata = {}
+        # Ordered from the least to the most recently used entity
+        self._entities_and_metadata = collections.OrderedDict()
+        # TrackedEntity instances that record their own changes and the ones that changed since they were tracked,
+        # all other entities are compared with their original value in save_changes
+        self._change_tracked_entities = set()
+        self._dirty_entities = set()
+        self._compared_entities = set()
         self._known_missing_ids = set()
         self.id_value = None
         self._defer_commands = set()
         self._number_of_requests_in_session = 0
-        self._query = None
+        self._pending_lazy_operations = []
         self.advanced = Advanced(self)
         self._force_read_from_master = force_read_from_master
+        # A read only session: the entities are not kept (or compared) and every load goes to the server
+        self._no_tracking = no_tracking
 
     def __enter__(self):
         return self
@@ -53,43 +182,163 @@ class documentsession(object):
     def entities_and_metadata(self):
         return self._entities_and_metadata
 
+    @property
+    def no_tracking(self):
+        return self._no_tracking
+
+    def _assert_tracking(self, operation):
+        if self._no_tracking:
+            raise exceptions.InvalidOperationException(
+                "Cannot {0} in a session that was opened with no_tracking".format(operation))
+
     @property
     def conventions(self):
         return self.document_store.conventions
 
     @property
     def query(self):
-        if self._query is None:
-            self._query = Query(self)
-        return self._query
+        # Every query gets its own builder, so a query that is not executed yet (e.g. a lazy one) is not changed
+        return Query(self)
 
     def save_includes(self, includes=None):
-        if includes:
+        # A session without tracking keeps nothing between its requests, not even the includes
+        if includes and not self._no_tracking:
             for include in includes:
                 if include["@metadata"]["@id"] not in self._entities_by_key:
                     self._includes[include["@metadata"]["@id"]] = include
 
-    def save_entity(self, key, entity, original_metadata, metadata, document, force_concurrency_check=False):
+    def save_entity(self, key, entity, original_metadata, metadata, document, force_concurrency_check=False,
+                    new_entity=False):
+        if self._no_tracking:
+            return
         if key is not None:
             self._known_missing_ids.discard(key)
 
             if key not in self._entities_by_key:
                 self._entities_by_key[key] = entity
 
-                self._entities_and_metadata[self._entities_by_key[key]] = {
-                    "original_value": document.copy(), "metadata": metadata,
-                    "original_metadata": original_metadata, "etag": metadata.get("etag", None), "key": key,
-                    "force_concurrency_check": force_concurrency_check}
+                metadata = _intern_metadata(metadata)
+                original_metadata = _intern_metadata(original_metadata)
+                snapshot = None
+                if isinstance(entity, tracked_entity.TrackedEntity) and not new_entity:
+                    # The entity was just built from the document, its lists and dicts are not held by anything else
+                    tracked_entity.track_loaded_entity(entity)
+                if isinstance(entity, tracked_entity.TrackedEntity) and \
+                        tracked_entity.start_tracking(entity, self._dirty_entities.add):
+                    self._change_tracked_entities.add(entity)
+                    metadata = tracked_entity.track_metadata(entity, metadata)
+                else:
+                    snapshot = self._snapshot(document)
+                    self._compared_entities.add(entity)
+
+                self._entities_and_metadata[self._entities_by_key[key]] = _DocumentInfo(
+                    key, metadata.get("etag", None), metadata, original_metadata, force_concurrency_check, snapshot,
+                    self.conventions.snapshot_mode)
+
+    def _snapshot(self, document, snapshot_mode=None):
+        """
+        @param document: the document (or the __dict__ of the entity) we want to keep the original value of
+        :type dict
+        @return: the snapshot of the document in the form the snapshot mode asks for
+        :rtype: dict or bytes
+        """
+        if snapshot_mode is None:
+            snapshot_mode = self.conventions.snapshot_mode
+        if snapshot_mode is SnapshotMode.copy:
+            return document.copy()
+        if "Id" in document:
+            # The Id is not part of the document we send to the server
+            document = document.copy()
+            document.pop("Id")
+        serialized = self._serialize(document)
+        if snapshot_mode is SnapshotMode.hashed:
+            return hashlib.sha1(serialized).digest()
+        return serialized
+
+    def _serialize(self, value):
+        return json.dumps(value, default=self.conventions.json_default_method, sort_keys=True,
+                          separators=(",", ":")).encode("utf-8")
+
+    def _mark_used(self, entities):
+        """
+        Move the entities to the end of the least recently used order and evict the entities
+        the session tracks over max_tracked_entities
+        """
+        if self.conventions.max_tracked_entities is None:
+            return
+        for entity in entities:
+            if entity in self._entities_and_metadata:
+                self._entities_and_metadata[entity] = self._entities_and_metadata.pop(entity)
+        self._evict_least_recently_used()
+
+    def _evict_least_recently_used(self):
+        """
+        Evict the least recently used entities that have no changes until the session tracks no more than
+        max_tracked_entities (changed, stored and deleted entities are kept until they are saved)
+        """
+        max_tracked_entities = self.conventions.max_tracked_entities
+        if max_tracked_entities is None or len(self._entities_and_metadata) <= max_tracked_entities:
+            return
+        to_evict = len(self._entities_and_metadata) - max_tracked_entities
+        unchanged = []
+        for entity in self._entities_and_metadata:
+            if len(unchanged) == to_evict:
+                break
+            if entity not in self._deleted_entities and not self._has_change(entity):
+                unchanged.append(entity)
+        for entity in unchanged:
+            self.evict(entity)
+
+    def evict(self, entity):
+        """
+        Stop tracking the entity, its changes are not saved (and its delete is not sent) by save_changes
+        and the next load of its key goes to the server
+        """
+        document_info = self._entities_and_metadata.pop(entity, None)
+        if document_info is None:
+            return
+        if self._entities_by_key.get(document_info.key, None) is entity:
+            del self._entities_by_key[document_info.key]
+        self._includes.pop(document_info.key, None)
+        self._deleted_entities.discard(entity)
+        self._stop_tracking(entity)
+
+    def clear(self):
+        """
+        Stop tracking all the entities and drop the pending deletes and deferred commands
+        """
+        for entity in self._change_tracked_entities:
+            tracked_entity.stop_tracking(entity)
+        self._entities_by_key.clear()
+        self._includes.clear()
+        self._deleted_entities.clear()
+        self._entities_and_metadata.clear()
+        self._change_tracked_entities.clear()
+        self._dirty_entities.clear()
+        self._compared_entities.clear()
+        self._known_missing_ids.clear()
+        self._defer_commands.clear()
+
+    def _stop_tracking(self, entity):
+        if entity in self._change_tracked_entities:
+            tracked_entity.stop_tracking(entity)
+            self._change_tracked_entities.discard(entity)
+            self._dirty_entities.discard(entity)
+        self._compared_entities.discard(entity)
 
     def _convert_and_save_entity(self, key, document, object_type, nested_object_types):
-        if key not in self._entities_by_key:
-            entity, metadata, original_metadata = Utils.convert_to_entity(document, object_type, self.conventions,
-                                                                          nested_object_types)
-            self.save_entity(key, entity, original_metadata, metadata, document)
+        if key in self._entities_by_key:
+            return self._entities_by_key[key]
+        entity, metadata, original_metadata = Utils.convert_to_entity(document, object_type, self.conventions,
+                                                                      nested_object_types)
+        self.save_entity(key, entity, original_metadata, metadata, document)
+        return entity
 
     def _multi_load(self, keys, object_type, includes, nested_object_types):
         if len(keys) == 0:
             return []
+        if self._no_tracking:
+            return self._load_without_tracking(keys, object_type, includes, nested_object_types)
 
         ids_of_not_existing_object = set(keys)
         if not includes:
@@ -107,18 +356,49 @@ class documentsession(object):
         if len(ids_of_not_existing_object) > 0:
             self.increment_requests_count()
             response = self.database_commands.get(ids_of_not_existing_object, includes)
-            if response:
-                results = response["Results"]
-                response_includes = response["Includes"]
-                for i in range(0, len(results)):
-                    if results[i] is None:
-                        self._known_missing_ids.add(ids_of_not_existing_object[i])
-                        continue
-                    self._convert_and_save_entity(ids_of_not_existing_object[i], results[i], object_type,
-                                                  nested_object_types)
-                self.save_includes(response_includes)
-        return [None if key in self._known_missing_ids else self._entities_by_key[
+            self._handle_load_response(ids_of_not_existing_object, response, object_type, nested_object_types)
+        results = [None if key in self._known_missing_ids else self._entities_by_key[
             key] if key in self._entities_by_key else None for key in keys]
+        self._mark_used(results)
+        return results
+
+    def _load_without_tracking(self, keys, object_type, includes, nested_object_types):
+        entities = {}
+        ids_to_load = list(collections.OrderedDict.fromkeys(keys))
+        if len(ids_to_load) > 0:
+            self.increment_requests_count()
+            response = self.database_commands.get(ids_to_load, includes)
+            entities.update(self._handle_load_response(ids_to_load, response, object_type, nested_object_types))
+        return [entities.get(key, None) for key in keys]
+
+    def _ids_to_load(self, keys, includes):
+        """
+        @return: the keys the session has to get from the server (the keys it does not know)
+        :rtype: list
+        """
+        if self._no_tracking:
+            return list(collections.OrderedDict.fromkeys(keys))
+        return [key for key in collections.OrderedDict.fromkeys(keys) if key not in self._known_missing_ids and (
+            includes or (key not in self._entities_by_key and key not in self._includes))]
+
+    def _handle_load_response(self, keys, response, object_type, nested_object_types):
+        """
+        @return: the entities of the documents that were found by their keys
+        :rtype: dict
+        """
+        entities = {}
+        if response:
+            results = response["Results"]
+            response_includes = response["Includes"]
+            for i in range(0, len(results)):
+                if results[i] is None:
+                    if not self._no_tracking:
+                        self._known_missing_ids.add(keys[i])
+                    continue
+                entities[keys[i]] = self._convert_and_save_entity(keys[i], results[i], object_type,
+                                                                  nested_object_types)
+            self.save_includes(response_includes)
+        return entities
 
     def load(self, key_or_keys, object_type=None, includes=None, nested_object_types=None):
         """
@@ -141,7 +421,13 @@ class documentsession(object):
 
         if isinstance(key_or_keys, list):
             return self._multi_load(key_or_keys, object_type, includes, nested_object_types)
+        if self._no_tracking:
+            return self._multi_load([key_or_keys], object_type, includes, nested_object_types)[0]
+        entity = self._load_one(key_or_keys, object_type, includes, nested_object_types)
+        self._mark_used([entity])
+        return entity
 
+    def _load_one(self, key_or_keys, object_type, includes, nested_object_types):
         if key_or_keys in self._known_missing_ids:
             return None
         if key_or_keys in self._entities_by_key and not includes:
@@ -169,15 +455,16 @@ class documentsession(object):
     def delete_by_entity(self, entity):
         if entity is None:
             raise ValueError("None entity is invalid")
+        self._assert_tracking("delete")
         if entity not in self._entities_and_metadata:
             raise exceptions.InvalidOperationException(
                 "{0} is not associated with the session, cannot delete unknown entity instance".format(entity))
-        if "Raven-Read-Only" in self._entities_and_metadata[entity]["original_metadata"]:
+        if "Raven-Read-Only" in self._entities_and_metadata[entity].original_metadata:
             raise exceptions.InvalidOperationException(
                 "{0} is marked as read only and cannot be deleted".format(entity))
         self._deleted_entities.add(entity)
-        self._known_missing_ids.add(self._entities_and_metadata[entity]["key"])
-        self._includes.pop(self._entities_and_metadata[entity]["key"], None)
+        self._known_missing_ids.add(self._entities_and_metadata[entity].key)
+        self._includes.pop(self._entities_and_metadata[entity].key, None)
 
     def delete(self, key_or_entity):
         """
@@ -186,6 +473,7 @@ class documentsession(object):
         """
         if key_or_entity is None:
             raise ValueError("None key is invalid")
+        self._assert_tracking("delete")
         if not isinstance(key_or_entity, str):
             self.delete_by_entity(key_or_entity)
             return
@@ -197,7 +485,7 @@ class documentsession(object):
             if entity not in self._entities_and_metadata:
                 raise exceptions.InvalidOperationException(
                     "{0} is not associated with the session, cannot delete unknown entity instance".format(entity))
-            if "Raven-Read-Only" in self._entities_and_metadata[entity]["original_metadata"]:
+            if "Raven-Read-Only" in self._entities_and_metadata[entity].original_metadata:
                 raise exceptions.InvalidOperationException(
                     "{0} is marked as read only and cannot be deleted".format(entity))
             self.delete_by_entity(entity)
@@ -225,10 +513,11 @@ class documentsession(object):
         """
         if entity is None:
             raise ValueError("None entity value is invalid")
+        self._assert_tracking("store")
         if entity in self._entities_and_metadata:
             if etag is not None:
-                self._entities_and_metadata[entity]["etag"] = etag
-            self._entities_and_metadata[entity]["force_concurrency_check"] = force_concurrency_check
+                self._entities_and_metadata[entity].etag = etag
+            self._entities_and_metadata[entity].force_concurrency_check = force_concurrency_check
             return
 
         if key is None:
@@ -256,9 +545,21 @@ class documentsession(object):
         metadata = self.conventions.build_default_metadata(entity)
         metadata["etag"] = etag
         self._deleted_entities.discard(entity)
-        self.save_entity(entity_id, entity, {}, metadata, {}, force_concurrency_check=force_concurrency_check)
-
-    def save_changes(self):
+        self.save_entity(entity_id, entity, {}, metadata, {}, force_concurrency_check=force_concurrency_check,
+                         new_entity=True)
+        if entity in self._change_tracked_entities:
+            # A new entity has to be saved even if it is not changed after we start tracking it
+            self._dirty_entities.add(entity)
+        self._evict_least_recently_used()
+
+    def save_changes(self, transactional=True):
+        """
+        @param transactional: True to save all the changes in a single batch (all or nothing),
+        False to split them to batches of conventions.save_changes_batch_size commands that are sent concurrently
+        and saved independently (the changes of a failed batch stay pending in the session)
+        :type bool
+        """
+        self._assert_tracking("save changes")
         data = _SaveChangesData(list(self._defer_commands), len(self._defer_commands))
         self._defer_commands.clear()
         self._prepare_for_delete_commands(data)
@@ -266,33 +567,127 @@ class documentsession(object):
         if len(data.commands) == 0:
             return
         self.increment_requests_count()
-        batch_result = self.database_commands.batch(data.commands)
+        batch_size = self.conventions.save_changes_batch_size
+        if transactional or not batch_size or len(data.commands) <= batch_size:
+            batch_result, error = self._send_batch(data)
+            if error is not None:
+                self._restore_save_changes_data(data)
+                raise error
+            self._update_batch_result(batch_result, data)
+            return
+
+        chunks = [data.slice(start, start + batch_size) for start in range(0, len(data.commands), batch_size)]
+        pool = ThreadPool(processes=min(self.conventions.save_changes_parallelism, len(chunks)))
+        try:
+            results = pool.map(self._send_batch, chunks)
+        finally:
+            pool.close()
+        errors = []
+        for chunk, (batch_result, error) in zip(chunks, results):
+            if error is not None:
+                self._restore_save_changes_data(chunk)
+                errors.append(error)
+                continue
+            try:
+                self._update_batch_result(batch_result, chunk)
+            except exceptions.DocumentDoesNotExistsException as e:
+                errors.append(e)
+        if errors:
+            raise exceptions.SaveChangesException(
+                "{0} of the {1} batches were not saved, their changes are still pending in the session: {2}".format(
+                    len(errors), len(chunks), errors[0]), errors)
+
+    def _send_batch(self, data):
+        """
+        @return: the batch result and None or None and the error
+        :rtype: tuple
+        """
+        try:
+            batch_result = self.database_commands.batch(data.commands)
+        except Exception as e:
+            return None, e
         if batch_result is None:
-            raise exceptions.InvalidOperationException(
+            return None, exceptions.InvalidOperationException(
                 "Cannot call Save Changes after the document store was disposed.")
-        self._update_batch_result(batch_result, data)
+        return batch_result, None
+
+    def _restore_save_changes_data(self, data):
+        """
+        Put the changes of a batch that was not saved back in the session, so the next save_changes sends them again
+        """
+        for command in data.commands[:data.deferred_command_count]:
+            self._defer_commands.add(command)
+        for entity, command in zip(data.entities, data.commands[data.deferred_command_count:]):
+            if entity is None:
+                self._defer_commands.add(command)
+            elif entity in data.deleted_documents:
+                document_info = data.deleted_documents[entity]
+                self._entities_and_metadata[entity] = document_info
+                self._entities_by_key[document_info.key] = entity
+                self._deleted_entities.add(entity)
+                if isinstance(entity, tracked_entity.TrackedEntity) and document_info.snapshot is None:
+                    tracked_entity.start_tracking(entity, self._dirty_entities.add)
+                    self._change_tracked_entities.add(entity)
+                else:
+                    self._compared_entities.add(entity)
+            elif entity in self._entities_and_metadata:
+                self._entities_by_key[self._entities_and_metadata[entity].key] = entity
 
     def _update_batch_result(self, batch_result, data):
 
         i = data.deferred_command_count
         batch_result_length = len(batch_result)
+        missing_keys = []
         while i < batch_result_length:
             item = batch_result[i]
-            if item["Method"] == "PUT":
+            if item["Method"] == "EVAL":
+                entity = data.entities[i - data.deferred_command_count]
+                if entity in self._entities_and_metadata:
+                    self._entities_by_key[item["Key"]] = entity
+                    if item.get("PatchResult", None) == "DocumentDoesNotExists":
+                        missing_keys.append(item["Key"])
+                    else:
+                        self._update_patched_entity(entity, item)
+            elif item["Method"] == "PUT":
                 entity = data.entities[i - data.deferred_command_count]
                 if entity in self._entities_and_metadata:
                     self._entities_by_key[item["Key"]] = entity
                     document_metadata = self._entities_and_metadata[entity]
-                    document_metadata["etag"] = str(item["Etag"])
-                    document_metadata["original_metadata"] = item["Metadata"].copy()
-                    document_metadata["metadata"] = item["Metadata"]
-                    document_metadata["original_value"] = entity.__dict__.copy()
+                    document_metadata.etag = str(item["Etag"])
+                    metadata = _intern_metadata(item["Metadata"])
+                    document_metadata.original_metadata = metadata
+                    document_metadata.metadata = metadata
+                    if entity in self._change_tracked_entities:
+                        self._dirty_entities.discard(entity)
+                        if tracked_entity.clear_changes(entity):
+                            document_metadata.metadata = tracked_entity.track_metadata(entity, metadata)
+                        else:
+                            # The entity now holds values we cannot record the changes of
+                            self._stop_tracking(entity)
+                            self._compared_entities.add(entity)
+                    if entity in self._compared_entities:
+                        document_metadata.snapshot = self._snapshot(entity.__dict__, document_metadata.snapshot_mode)
             i += 1
+        if missing_keys:
+            raise exceptions.DocumentDoesNotExistsException(
+                "Cannot patch the changes, the documents {0} do not exist anymore".format(", ".join(missing_keys)))
+
+    def _update_patched_entity(self, entity, item):
+        # A patch result does not carry the metadata, we keep ours with the new etag
+        document_metadata = self._entities_and_metadata[entity]
+        document_metadata.etag = str(item["Etag"])
+        document_metadata.metadata["@etag"] = str(item["Etag"])
+        document_metadata.original_metadata = document_metadata.metadata
+        if entity in self._change_tracked_entities:
+            self._dirty_entities.discard(entity)
+            tracked_entity.clear_changes(entity)
+        if entity in self._compared_entities:
+            document_metadata.snapshot = self._snapshot(entity.__dict__, document_metadata.snapshot_mode)
 
     def _prepare_for_delete_commands(self, data):
         keys_to_delete = []
         for entity in self._deleted_entities:
-            keys_to_delete.append(self._entities_and_metadata[entity]["key"])
+            keys_to_delete.append(self._entities_and_metadata[entity].key)
 
         for key in keys_to_delete:
             existing_entity = None
@@ -300,36 +695,131 @@ class documentsession(object):
             if key in self._entities_by_key:
                 existing_entity = self._entities_by_key[key]
                 if existing_entity in self._entities_and_metadata:
-                    etag = self._entities_and_metadata[existing_entity]["metadata"][
+                    etag = self._entities_and_metadata[existing_entity].metadata[
                         "@etag"] if self.advanced.use_optimistic_concurrency else None
-                self._entities_and_metadata.pop(existing_entity, None)
+                    data.deleted_documents[existing_entity] = self._entities_and_metadata.pop(existing_entity)
                 self._entities_by_key.pop(key, None)
+                self._stop_tracking(existing_entity)
             data.entities.append(existing_entity)
             data.commands.append(commands_data.DeleteCommandData(key, etag))
         self._deleted_entities.clear()
 
+    def _entities_to_check(self):
+        if not self._change_tracked_entities:
+            return self._entities_and_metadata
+        # Only the tracked entities that recorded a change need to be visited
+        return list(self._compared_entities) + [entity for entity in self._dirty_entities if
+                                                entity in self._entities_and_metadata]
+
     def _prepare_for_puts_commands(self, data):
-        for entity in self._entities_and_metadata:
+        for entity in self._entities_to_check():
             if self._has_change(entity):
-                key = self._entities_and_metadata[entity]["key"]
-                metadata = self._entities_and_metadata[entity]["metadata"]
+                key = self._entities_and_metadata[entity].key
+                metadata = self._entities_and_metadata[entity].metadata
                 etag = None
                 if self.advanced.use_optimistic_concurrency \
-                        or self._entities_and_metadata[entity]["force_concurrency_check"]:
-                    etag = self._entities_and_metadata[entity]["etag"] or metadata.get("@etag", Utils.empty_etag())
+                        or self._entities_and_metadata[entity].force_concurrency_check:
+                    etag = self._entities_and_metadata[entity].etag or metadata.get("@etag", Utils.empty_etag())
                 data.entities.append(entity)
+                patch = self._build_patch(entity) if self.advanced.use_patches_for_changes else None
                 if key is not None:
                     self._entities_by_key.pop(key)
                     document = entity.__dict__.copy()
                     document.pop('Id', None)
-                data.commands.append(commands_data.PutCommandData(key, etag, document, metadata))
+                if patch is not None:
+                    data.commands.append(commands_data.ScriptedPatchCommandData(key, patch, etag))
+                else:
+                    data.commands.append(commands_data.PutCommandData(key, etag, document, metadata))
+
+    def _build_patch(self, entity):
+        """
+        Build a patch that sets only the fields of the entity that changed since it was loaded (or saved)
+
+        @param entity: a changed entity
+        :type object
+        @return: the patch or None when the whole document has to be sent (a new document, changed metadata
+        or a snapshot we cannot compare field by field)
+        :rtype: ScriptedPatchRequest
+        """
+        document_info = self._entities_and_metadata[entity]
+        if document_info.key is None or "@etag" not in document_info.metadata:
+            return None
+        if entity in self._change_tracked_entities:
+            dirty_attributes = tracked_entity.get_dirty_attributes(entity)
+            if tracked_entity.METADATA in dirty_attributes:
+                return None
+            changed_fields = [field for field in dirty_attributes if field != "Id"]
+        else:
+            original_value = document_info.original_value
+            if original_value is None or document_info.metadata_changed():
+                return None
+            changed_fields = [field for field in set(original_value) | set(entity.__dict__) if field != "Id" and (
+                field not in original_value or field not in entity.__dict__ or
+                self._serialize(original_value[field]) != self._serialize(entity.__dict__[field]))]
+        if not changed_fields:
+            return None
+
+        # The field names and values are passed as patch values so the script text depends only on the
+        # number of changes and the server can reuse the compiled script
+        script = []
+        values = {}
+        for i, field in enumerate(sorted(changed_fields)):
+            values["field{0}".format(i)] = field
+            if field in entity.__dict__:
+                values["value{0}".format(i)] = entity.__dict__[field]
+                script.append("this[field{0}] = value{0};".format(i))
+            else:
+                script.append("delete this[field{0}];".format(i))
+        return ScriptedPatchRequest("".join(script), values)
 
     def _has_change(self, entity):
-        if self._entities_and_metadata[entity]["original_metadata"] != self._entities_and_metadata[entity]["metadata"] \
-                or self._entities_and_metadata[entity]["original_value"] != entity.__dict__:
+        if entity in self._change_tracked_entities:
+            return entity in self._dirty_entities
+        document_info = self._entities_and_metadata[entity]
+        if document_info.metadata_changed() \
+                or document_info.snapshot != self._snapshot(entity.__dict__, document_info.snapshot_mode):
             return True
         return False
 
+    def add_lazy_operation(self, operation):
+        """
+        @param operation: an operation that will be sent with the other pending lazy operations
+        :type LazyOperation
+        @return: the lazy value of the operation
+        :rtype: Lazy
+        """
+        self._pending_lazy_operations.append(operation)
+        return lazy.Lazy(self, operation)
+
+    def execute_all_pending_lazy_operations(self):
+        """
+        Send all the pending lazy operations to the server in a single multi_get request
+        """
+        operations = self._pending_lazy_operations
+        self._pending_lazy_operations = []
+        try:
+            requests = []
+            for operation in operations:
+                path = operation.create_request()
+                if path is not None:
+                    requests.append((operation, path))
+            results = []
+            if requests:
+                self.increment_requests_count()
+                results = self.database_commands.multi_get([path for __, path in requests],
+                                                           force_read_from_master=self._force_read_from_master)
+        except Exception:
+            # Nothing was handled, the operations are sent again the next time a value is needed
+            self._pending_lazy_operations = operations + self._pending_lazy_operations
+            raise
+        responses = {operation: result for (operation, __), result in zip(requests, results)}
+        for operation in operations:
+            # A failed operation keeps its error for its own value, it does not fail the others
+            try:
+                operation.handle_response(responses.get(operation, None))
+            except Exception as e:
+                operation.error = e
+
     def increment_requests_count(self):
         self._number_of_requests_in_session += 1
         if self._number_of_requests_in_session > self.conventions.max_number_of_request_per_session:
@@ -348,12 +838,92 @@ class Advanced(object):
     def __init__(self, session):
         self.session = session
         self.use_optimistic_concurrency = session.conventions.default_use_optimistic_concurrency
+        self.use_patches_for_changes = session.conventions.use_patches_for_changes
+        self.lazily = lazy.LazySessionOperations(session)
 
     def number_of_requests_in_session(self):
         return self.session.number_of_requests_in_session
 
+    def memory_usage(self):
+        """
+        Estimate the memory the session holds for the documents it tracks.
+        Strings shared between documents (like the interned metadata) are counted once
+
+        @return: the number of documents and the bytes taken by the entities, the snapshots of the original values,
+        the metadata and the total
+        :rtype: dict
+        """
+        seen = set()
+        usage = {"documents": len(self.session.entities_and_metadata), "entities": 0, "snapshots": 0, "metadata": 0}
+        for entity, document_info in self.session.entities_and_metadata.items():
+            usage["entities"] += _sizeof(entity, seen)
+            usage["snapshots"] += _sizeof(document_info.snapshot, seen)
+            usage["metadata"] += sys.getsizeof(document_info) + _sizeof(document_info.metadata, seen) + \
+                _sizeof(document_info._original_metadata, seen)
+        usage["total"] = usage["entities"] + usage["snapshots"] + usage["metadata"]
+        return usage
+
+    def execute_all_pending_lazy_operations(self):
+        self.session.execute_all_pending_lazy_operations()
+
+    def stream(self, query):
+        """
+        Get all the results of a query with a single streaming request, without paging.
+        The results are read and converted one at a time and the session does not track them
+
+        @param query: the query to stream (the page size limits the results only when take was called)
+        :type Query
+        @return: the results of the query
+        :rtype: generator of StreamResult
+        """
+        query._assert_not_parameterized()
+        session = self.session
+        session.increment_requests_count()
+        results = session.database_commands.stream_query(query.index_name, query._build_index_query(),
+                                                         force_read_from_master=session._force_read_from_master)
+        return stream.convert_results(results, session.conventions, query.object_type, query.nested_object_types,
+                                      fetch=bool(query.fetch))
+
+    def stream_docs(self, from_etag=None, starts_with=None, matches=None, start=0, page_size=None, object_type=None,
+                    nested_object_types=None, exclude=None, skip_after=None):
+        """
+        Get the documents of the database (or the documents whose key starts with a prefix) with a single
+        streaming request, without an index. The documents are read and converted one at a time
+        and the session does not track them.
+        To resume a stream pass the etag (or with starts_with, the key) of the last result as from_etag (skip_after)
+
+        @param from_etag: stream the documents that were changed after this etag
+        :type str
+        @param starts_with: stream the documents whose key starts with this prefix
+        :type str
+        @param matches: pipe separated wildcards the key (after the prefix) has to match
+        :type str
+        @param object_type: The class we want to get
+        :type classObj:
+        @return: the documents in the order of their etags (or keys when starts_with is used)
+        :rtype: generator of StreamResult
+        """
+        session = self.session
+        session.increment_requests_count()
+        results = session.database_commands.stream_docs(
+            from_etag, starts_with, matches, start, page_size, exclude, skip_after,
+            force_read_from_master=session._force_read_from_master)
+        return stream.convert_results(results, session.conventions, object_type, nested_object_types)
+
+    def evict(self, entity):
+        """
+        Stop tracking an entity (its changes are not saved and the next load of its key goes to the server)
+        """
+        self.session.evict(entity)
+
+    def clear(self):
+        """
+        Stop tracking all the entities of the session, for long running loops that load and save page after page
+        """
+        self.session.clear()
+
     def get_document_id(self, instance):
         if instance is not None:
             if instance in self.session.entities_and_metadata:
-                return self.session.entities_and_metadata[instance]["key"]
+                return self.session.entities_and_metadata[instance].key
         return None
@@ -1,14 +1,32 @@
 from pyravendb.connection.requests_factory import HttpRequestsFactory
 from pyravendb.custom_exceptions import exceptions
 from pyravendb.d_commands import database_commands
+from pyravendb.d_commands.batching_loader import BatchingLoader
 from pyravendb.data.document_convention import DocumentConvention
 from pyravendb.hilo.hilo_generator import HiloGenerator
 from pyravendb.data.database import DatabaseDocument
 from pyravendb.store.document_session import documentsession
+from pyravendb.store.bulk_insert import BulkInsertOperation
+from pyravendb.store.changes import DatabaseChanges
+from pyravendb.store.subscriptions import DocumentSubscriptions
 from pyravendb.tools.utils import Utils
 from pyravendb.data.operations import Operations
 import traceback
+import weakref
 import uuid
+import os
+
+# The stores that are alive, a single fork hook resets all of them in the child process
+_stores = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for store in list(_stores):
+        store._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
 
 
 class documentstore(object):
@@ -22,6 +40,10 @@ class documentstore(object):
         self._initialize = False
         self.generator = None
         self._operations = None
+        self._changes = None
+        self.subscriptions = DocumentSubscriptions(self)
+        self._pid = os.getpid()
+        _stores.add(self)
 
     def __enter__(self):
         return self
@@ -43,6 +65,9 @@ class documentstore(object):
         if not self._initialize:
             self._operations = Operations(self._requests_handler)
             self._database_commands = database_commands.DatabaseCommands(self._requests_handler)
+            if self.conventions.load_batching_window:
+                self._database_commands.batching_loader = BatchingLoader(self._database_commands,
+                                                                         self.conventions.load_batching_window)
             if self.database is None:
                 raise exceptions.InvalidOperationException("None database is not valid")
             if not self.database.lower() == self.conventions.system_database:
@@ -58,16 +83,44 @@ class documentstore(object):
                         self._database_commands.admin_commands.create_database(
                             DatabaseDocument(self.database, {"Raven/DataDir": "~\\{0}".format(self.database)}))
             self._requests_handler.get_replication_topology()
-            self.generator = HiloGenerator(self.conventions.max_ids_to_catch, self._database_commands)
+            self.generator = HiloGenerator(self.conventions.max_ids_to_catch, self._database_commands,
+                                           self.conventions.max_hilo_capacity,
+                                           self.conventions.hilo_prefetch_low_water_mark)
             self._initialize = True
 
+    def _check_fork(self):
+        # Fallback for python versions without os.register_at_fork
+        if self._pid != os.getpid():
+            self._after_fork()
+
+    def _after_fork(self):
+        """
+        Reset everything the child process must not share with its parent: the locks (that may be held
+        by threads that do not exist in the child), the timers and the hilo ranges (using them in both
+        processes would generate the same ids). The conventions and the replication topology are kept
+        """
+        self._pid = os.getpid()
+        self._requests_handler.after_fork()
+        if self.generator is not None:
+            self.generator.reset()
+        if self._database_commands is not None and self._database_commands.batching_loader is not None:
+            self._database_commands.batching_loader.reset()
+        # The thread of the changes client does not exist in the child
+        self._changes = None
+
     def _assert_initialize(self):
+        self._check_fork()
         if not self._initialize:
             raise exceptions.InvalidOperationException(
                 "You cannot open a session or access the database commands before initializing the document store.\
                 Did you forget calling initialize()?")
 
-    def open_session(self, database=None, api_key=None, force_read_from_master=False):
+    def open_session(self, database=None, api_key=None, force_read_from_master=False, no_tracking=False):
+        """
+        @param no_tracking: True for a read only session that does not keep the entities it loads
+        (every load goes to the server and store, delete and save_changes are not allowed)
+        :type bool
+        """
         self._assert_initialize()
         session_id = uuid.uuid4()
         database_commands_for_session = self._database_commands
@@ -79,7 +132,76 @@ class documentstore(object):
             if response.status_code != 200:
                 raise exceptions.ErrorResponseException("Could not open database named:{0}".format(database))
             database_commands_for_session = database_commands.DatabaseCommands(requests_handler)
-        return documentsession(database, self, database_commands_for_session, session_id, force_read_from_master)
+        return documentsession(database, self, database_commands_for_session, session_id, force_read_from_master,
+                               no_tracking=no_tracking)
+
+    def changes(self):
+        """
+        The client of the changes endpoint of the database, for notifications about changed documents and indexes
+        (one connection is shared by all the subscribers of the store)
+
+        @return: the changes client, e.g. changes().for_document("users/1").subscribe(callback)
+        :rtype: DatabaseChanges
+        """
+        self._assert_initialize()
+        if self._changes is None or self._changes._closed:
+            self._changes = DatabaseChanges(self._requests_handler)
+        return self._changes
+
+    def bulk_insert(self, check_for_updates=False, skip_overwriting=False, batch_size=512):
+        """
+        Insert a large number of documents without a session, use it with a with statement
+        (the documents that are left are sent when it ends)
+
+        @param check_for_updates: True if documents that already exist may be overwritten
+        :type bool
+        @param skip_overwriting: True to skip the documents that already exist instead of failing
+        :type bool
+        @param batch_size: the number of documents in the first batch (it changes with the time the batches take)
+        :type int
+        @return: the operation, store the entities (or dicts) with its store method
+        :rtype: BulkInsertOperation
+        """
+        self._assert_initialize()
+        return BulkInsertOperation(self, check_for_updates=check_for_updates, skip_overwriting=skip_overwriting,
+                                   batch_size=batch_size)
 
     def generate_id(self, entity):
+        self._check_fork()
         return self.generator.generate_document_id(entity, self.conventions, self._requests_handler)
+
+    def generate_ids(self, entity_type_or_tag, count=None):
+        """
+        Reserve ids ahead of storing a known number of entities
+
+        @param entity_type_or_tag: the class (or the collection name) we want the ids for.
+        Can be a dict of classes or collection names and the number of ids each of them needs,
+        all the collections that run out of ids will be refilled in a single round trip
+        :type type or str or dict
+        @param count: the number of ids to reserve (when entity_type_or_tag is not a dict)
+        :type int
+        @return: a contiguous block of ids (a dict with the ids for each key when entity_type_or_tag is a dict)
+        :rtype: list or dict
+        """
+        self._assert_initialize()
+        if isinstance(entity_type_or_tag, dict):
+            counts = entity_type_or_tag
+        elif count is None:
+            raise ValueError("None count is invalid")
+        else:
+            counts = {entity_type_or_tag: count}
+
+        type_tag_names = {}
+        for key in counts:
+            type_tag_name = key
+            if isinstance(key, type):
+                type_tag_name = self.conventions.default_transform_type_tag_name(key.__name__)
+            if type_tag_name in type_tag_names.values():
+                raise ValueError("{0} appears more than once".format(type_tag_name))
+            type_tag_names[key] = type_tag_name
+
+        ids = self.generator.generate_document_ids({type_tag_names[key]: counts[key] for key in counts},
+                                                   self._requests_handler)
+        if not isinstance(entity_type_or_tag, dict):
+            return ids[type_tag_names[entity_type_or_tag]]
+        return {key: ids[type_tag_names[key]] for key in counts}
@@ -0,0 +1,134 @@
+from pyravendb.custom_exceptions import exceptions
+
+
+class Lazy(object):
+    """
+    The value of an operation that is sent to the server together with all the other pending lazy operations
+    of the session, the first time one of their values is needed
+    """
+
+    def __init__(self, session, operation):
+        self._session = session
+        self._operation = operation
+
+    @property
+    def is_value_created(self):
+        return self._operation.done
+
+    @property
+    def value(self):
+        operation = self._operation
+        if not operation.done and operation.error is None:
+            self._session.execute_all_pending_lazy_operations()
+        if operation.error is not None:
+            raise operation.error
+        if not operation.done:
+            raise exceptions.InvalidOperationException("The lazy operation was not executed")
+        return operation.result
+
+
+class LazyOperation(object):
+    def __init__(self):
+        self.done = False
+        self.result = None
+        # The exception handle_response raised, the other operations of the request are handled regardless
+        self.error = None
+
+    def create_request(self):
+        """
+        @return: the path of the GET request (relative to the database) or None if the operation
+        does not need the server
+        :rtype: str
+        """
+        raise NotImplementedError
+
+    def handle_response(self, response):
+        """
+        @param response: the json result of the request (None when the operation did not make one)
+        :type dict
+        """
+        raise NotImplementedError
+
+
+class LazyLoadOperation(LazyOperation):
+    def __init__(self, session, key_or_keys, object_type=None, includes=None, nested_object_types=None):
+        super(LazyLoadOperation, self).__init__()
+        self.session = session
+        self.keys = key_or_keys if isinstance(key_or_keys, list) else [key_or_keys]
+        self.single = not isinstance(key_or_keys, list)
+        self.object_type = object_type
+        self.includes = includes
+        self.nested_object_types = nested_object_types
+        self._ids_to_load = []
+
+    def create_request(self):
+        self._ids_to_load = self.session._ids_to_load(self.keys, self.includes)
+        if not self._ids_to_load:
+            return None
+        path, __, __ = self.session.database_commands.build_get_request(self._ids_to_load, self.includes,
+                                                                         allow_post=False)
+        return path
+
+    def handle_response(self, response):
+        entities = {}
+        if response is not None:
+            entities = self.session._handle_load_response(self._ids_to_load, response, self.object_type,
+                                                          self.nested_object_types)
+        if self.session.no_tracking:
+            results = [entities.get(key, None) for key in self.keys]
+        else:
+            # Every key is known to the session by now, so this does not go to the server
+            results = self.session._multi_load(self.keys, self.object_type, None, self.nested_object_types)
+        self.result = results[0] if self.single else results
+        self.done = True
+
+
+class LazyQueryOperation(LazyOperation):
+    def __init__(self, query, index_query):
+        super(LazyQueryOperation, self).__init__()
+        self.query = query
+        self.index_query = index_query
+
+    def create_request(self):
+        return self.query.session.database_commands.build_query_path(self.query.index_name, self.index_query,
+                                                                     includes=self.query.includes)
+
+    def handle_response(self, response):
+        if response is None:
+            # multi_get has no result for a request the server answered with 404 (e.g. a missing index)
+            raise exceptions.ErrorResponseException(
+                "The query on index {0} has no result (does the index exist?)".format(self.query.index_name))
+        if response["IsStale"] and self.query.wait_for_non_stale_results:
+            # We cannot wait inside a multi_get, the query is executed on its own
+            self.result = self.query._execute_query()
+        else:
+            self.result = self.query._handle_query_response(response)
+        self.done = True
+
+
+class LazySessionOperations(object):
+    def __init__(self, session):
+        self.session = session
+
+    def load(self, key_or_keys, object_type=None, includes=None, nested_object_types=None):
+        """
+        Load documents when their value is first needed, together with all the other lazy operations
+
+        @param key_or_keys: Identifier of a document that will be loaded.
+        :type str or list
+        @param object_type: The class we want to get
+        :type classObj:
+        @param includes: The path to a reference inside the loaded documents can be list (property name)
+        :type list or str
+        @param nested_object_types: A dict of classes for nested object the key will be the name of the class and the
+         value will be the object we want to get for that attribute
+        :type str
+        @return: the lazy value of the entity or the list of entities
+        :rtype: Lazy
+        """
+        if not key_or_keys:
+            raise ValueError("None or empty key is invalid")
+        if includes and not isinstance(includes, list):
+            includes = [includes]
+        return self.session.add_lazy_operation(
+            LazyLoadOperation(self.session, key_or_keys, object_type, includes, nested_object_types))
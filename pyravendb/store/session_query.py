@@ -1,12 +1,23 @@
 from enum import Enum
 from pyravendb.custom_exceptions.exceptions import *
 from pyravendb.data.indexes import IndexQuery
+from pyravendb.store.lazy import LazyQueryOperation
 from pyravendb.tools.utils import Utils
-from datetime import timedelta
+from multiprocessing.pool import ThreadPool
+from datetime import datetime, timedelta
+from collections import namedtuple
+import logging
+import uuid
 import sys
 import time
 import re
 
+# The time (in seconds) we wait before querying a stale index again, it doubles up to _max_stale_delay
+_min_stale_delay = 0.05
+_max_stale_delay = 1
+
+_log = logging.getLogger(__name__)
+
 
 class EscapeQueryOptions(Enum):
     EscapeAll = 0
@@ -15,6 +26,97 @@ class EscapeQueryOptions(Enum):
     RawQuery = 3
 
 
+class Projection(Enum):
+    """
+    What the results of a query that selects fields are made of
+    """
+    # Entities (the fields are converted like a document, with its metadata)
+    entity = 0
+    # Tuples of the values of the fields (in the order of select)
+    tuple = 1
+    # Named tuples of the values of the fields
+    named_tuple = 2
+    # Dicts of the fields and their values
+    dict = 3
+
+
+class QueryParameter(object):
+    """
+    A value that is given when a compiled query is executed
+    """
+
+    def __init__(self, name, value_type=None):
+        """
+        @param name: the name of the parameter in CompiledQuery.execute
+        :type str
+        @param value_type: the type of the values (int and float values are queried as numbers, e.g. with _Range fields,
+        the sort hint comes from the type so int values over sys.maxsize are not sorted as long)
+        :type type
+        """
+        self.name = name
+        self.value_type = value_type
+
+
+class CompiledQuery(object):
+    """
+    The path of a query that is built (and escaped) once, executing it only puts the values of its parameters
+    in their places
+    """
+
+    def __init__(self, query, path, parameters):
+        self.index_name = query.index_name
+        self.object_type = query.object_type
+        self.nested_object_types = query.nested_object_types
+        self.includes = query.includes
+        self.fetch = query.fetch
+        self.wait_for_non_stale_results = query.wait_for_non_stale_results
+        self.with_statistics = query._with_statistics
+        self.wait_timeout = query._wait_timeout
+        self.wait_as_of_now = query._wait_as_of_now
+        self.projection = query._projection
+        self.parameter_names = set(name for __, name, __ in parameters)
+        # The static parts of the path and, in between them, the places of the parameters
+        self._parts = []
+        self._slots = []
+        for token, name, formatter in parameters:
+            before, __, path = path.partition(token)
+            self._parts.append(before)
+            self._slots.append((len(self._parts), name, formatter))
+            self._parts.append(None)
+        self._parts.append(path)
+
+    def path(self, **values):
+        """
+        @return: the path of the query with the values of the parameters
+        :rtype: str
+        """
+        missing = self.parameter_names.difference(values)
+        if missing:
+            raise ValueError("Missing values for the parameters: {0}".format(", ".join(sorted(missing))))
+        parts = list(self._parts)
+        for position, name, formatter in self._slots:
+            parts[position] = Utils.quote_key(str(formatter(values[name])))
+        return "".join(parts)
+
+    def execute(self, session, **values):
+        """
+        @param session: the session that runs the query (and tracks its results)
+        :type documentsession
+        @param values: the values of the parameters
+        @return: the results of the query
+        :rtype: list
+        """
+        query = Query(session)(object_type=self.object_type, index_name=self.index_name,
+                               wait_for_non_stale_results=self.wait_for_non_stale_results, includes=self.includes,
+                               with_statistics=self.with_statistics, nested_object_types=self.nested_object_types)
+        query.fetch = self.fetch
+        query._wait_timeout = self.wait_timeout
+        query._wait_as_of_now = self.wait_as_of_now
+        query._projection = self.projection
+        query._compiled_path = self.path(**values)
+        return query._execute_query()
+
+
 class Query(object):
     def __init__(self, session):
         self.session = session
@@ -25,6 +127,15 @@ class Query(object):
         self.fetch = None
         self._page_size = None
         self._start = None
+        # The tokens that stand for the query parameters in the query text
+        self._parameters = []
+        self._compiled_path = None
+        self._prefetch = False
+        self._wait_as_of_now = False
+        self._cutoff_etag = None
+        self._wait_timeout = None
+        self._projection = Projection.entity
+        self._show_timings = False
 
     def __call__(self, object_type=None, index_name=None, using_default_operator=None,
                  wait_for_non_stale_results=False, includes=None, with_statistics=False, nested_object_types=None):
@@ -55,19 +166,29 @@ class Query(object):
         self._with_statistics = with_statistics
         return self
 
-    def select(self, *args):
+    def select(self, *args, **kwargs):
         """
         Fetch only the required fields from the server
 
         @param args: The name of the terms you like to acquire
-
+        @param projection: What the results are made of, the tuple, named_tuple and dict projections
+        are made straight from the fetched fields (without metadata and without converting them to entities)
+        :type Projection
         """
+        projection = kwargs.pop("projection", Projection.entity)
+        if kwargs:
+            raise TypeError("select got an unexpected keyword argument '{0}'".format(next(iter(kwargs))))
+        if not isinstance(projection, Projection):
+            raise ValueError("projection must be Projection type")
         if args:
             self.fetch = args
+        elif projection != Projection.entity:
+            raise ValueError("A projection needs the names of the fields to select")
+        self._projection = projection
         return self
 
-    def _lucene_builder(self, value, action=None, escape_query_options=EscapeQueryOptions.EscapeAll):
-
+    @staticmethod
+    def _escape(value, escape_query_options):
         if isinstance(value, str):
             if escape_query_options == EscapeQueryOptions.EscapeAll:
                 value = Utils.escape(value, False, False)
@@ -79,8 +200,55 @@ class Query(object):
                 value = re.sub(r'"\\\*(\s|$)"', "*${1}", value)
             elif escape_query_options == EscapeQueryOptions.RawQuery:
                 value = Utils.escape(value, False, False).replace("\\*", "*")
+        return value
+
+    @staticmethod
+    def _sample(value):
+        # A typed parameter stands for a value of its type when the field name and the sort hint are chosen
+        if isinstance(value, QueryParameter):
+            return value.value_type() if value.value_type is not None else None
+        return value
+
+    def _parameter_token(self, parameter, formatter):
+        """
+        @param formatter: makes the lucene text of a value of the parameter
+        :type function
+        @return: the token that stands for the parameter in the query text until the query is compiled
+        :rtype: str
+        """
+        token = "QueryParameter{0}x{1}".format(uuid.uuid4().hex, len(self._parameters))
+        self._parameters.append((token, parameter.name, formatter))
+        return token
+
+    def _parameters_lucene(self, value, action, escape_query_options):
+        if isinstance(value, QueryParameter):
+            def formatter(parameter_value):
+                if action == "search":
+                    parameter_value = Utils.quote_key(str(parameter_value))
+                if action == "in" and not parameter_value:
+                    raise ValueError("The values of {0} cannot be empty".format(value.name))
+                return Utils.to_lucene(Query._escape(parameter_value, escape_query_options), action=action)
+
+            return self._parameter_token(value, formatter)
+
+        # The bounds of a range
+        bounds = []
+        for item, default in zip(value, ("*", "NULL")):
+            if isinstance(item, QueryParameter):
+                bounds.append(self._parameter_token(
+                    item, lambda bound, default=default: Utils.numeric_to_lucene_syntax(
+                        bound) if bound is not None else default))
+            else:
+                bounds.append(Utils.numeric_to_lucene_syntax(item) if item is not None else default)
+        return ("{{{0} TO {1}}}" if action == "between" else "[{0} TO {1}]").format(*bounds)
 
-        lucene_text = Utils.to_lucene(value, action=action)
+    def _lucene_builder(self, value, action=None, escape_query_options=EscapeQueryOptions.EscapeAll):
+
+        if isinstance(value, QueryParameter) or (action in ("between", "equal_between") and any(
+                isinstance(item, QueryParameter) for item in value)):
+            lucene_text = self._parameters_lucene(value, action, escape_query_options)
+        else:
+            lucene_text = Utils.to_lucene(self._escape(value, escape_query_options), action=action)
 
         if len(self.query_builder) > 0 and not self.query_builder.endswith(' '):
             self.query_builder += ' '
@@ -91,7 +259,49 @@ class Query(object):
         return lucene_text
 
     def __iter__(self):
-        return self._execute_query().__iter__()
+        if self._with_statistics or self._compiled_path is not None:
+            return self._execute_query().__iter__()
+        return self._iterate_pages()
+
+    def _iterate_pages(self):
+        """
+        Get the results page after page as they are iterated (take limits the number of all the results).
+        The next page starts after the results and the skipped results (e.g. duplicates) of the current one,
+        so no result is repeated or missed. Like a single query, the iteration counts as one request of the session
+        """
+        self._assert_not_parameterized()
+        start = int(self._start or 0)
+        remaining = self._page_size
+        query_page_size = self.session.conventions.query_page_size
+        # All the pages are as of the time the iteration started
+        cutoff = self._cutoff()
+        pool = ThreadPool(processes=1) if self._prefetch else None
+        try:
+            page_size = query_page_size if remaining is None else min(query_page_size, remaining)
+            self.session.increment_requests_count()
+            pending = None
+            response = self._query_response(start, page_size, cutoff=cutoff)
+            while True:
+                results_count = len(response["Results"])
+                start += results_count + response.get("SkippedResults", 0)
+                if remaining is not None:
+                    remaining -= results_count
+                page_size = query_page_size if remaining is None else min(query_page_size, remaining)
+                has_next = results_count > 0 and page_size > 0 and start < response["TotalResults"]
+                if has_next and pool is not None:
+                    # The next page is on its way while the results of this one are processed
+                    pending = pool.apply_async(self._query_response, (start, page_size), {"cutoff": cutoff})
+                for result in self._handle_query_response(response):
+                    yield result
+                if not has_next:
+                    return
+                if pending is not None:
+                    response = pending.get()
+                else:
+                    response = self._query_response(start, page_size, cutoff=cutoff)
+        finally:
+            if pool is not None:
+                pool.terminate()
 
     def where_equals(self, field_name, value, escape_query_options=EscapeQueryOptions.EscapeAll):
         """
@@ -106,11 +316,12 @@ class Query(object):
         if field_name is None:
             raise ValueError("None field_name is invalid")
 
-        if value is not None and not isinstance(value, str) and field_name is not None:
-            sort_hint = self.session.conventions.get_default_sort_option(type(value).__name__)
+        sample = self._sample(value)
+        if sample is not None and not isinstance(sample, str) and field_name is not None:
+            sort_hint = self.session.conventions.get_default_sort_option(type(sample).__name__)
             if sort_hint:
                 if sys.version_info.major > 2:
-                    if value > sys.maxsize:
+                    if sample > sys.maxsize:
                         sort_hint = self.session.conventions.get_default_sort_option("long")
                 self._sort_hints.add("SortHint-{0}={1}".format(field_name, sort_hint))
 
@@ -144,7 +355,8 @@ class Query(object):
         @param escape_query_options: the way we should escape special characters
         :type EscapeQueryOptions
         """
-        search_terms = Utils.quote_key(str(search_terms))
+        if not isinstance(search_terms, QueryParameter):
+            search_terms = Utils.quote_key(str(search_terms))
         search_terms = self._lucene_builder(search_terms, "search", escape_query_options)
         self.query_builder += "{0}:{1}".format(field_name, search_terms)
         return self
@@ -161,12 +373,13 @@ class Query(object):
         if field_name is None:
             raise ValueError("None field_name is invalid")
 
-        if value is not None and not isinstance(value, str) and field_name is not None:
-            sort_hint = self.session.conventions.get_default_sort_option(type(value).__name__)
+        sample = self._sample(value)
+        if sample is not None and not isinstance(sample, str) and field_name is not None:
+            sort_hint = self.session.conventions.get_default_sort_option(type(sample).__name__)
             if sort_hint:
                 field_name = "{0}_Range".format(field_name)
                 if sys.version_info.major > 2:
-                    if value > sys.maxsize:
+                    if sample > sys.maxsize:
                         sort_hint = self.session.conventions.get_default_sort_option("long")
                 self._sort_hints.add("SortHint-{0}={1}".format(field_name, sort_hint))
 
@@ -186,12 +399,13 @@ class Query(object):
         if field_name is None:
             raise ValueError("None field_name is invalid")
 
-        if value is not None and not isinstance(value, str) and field_name is not None:
-            sort_hint = self.session.conventions.get_default_sort_option(type(value).__name__)
+        sample = self._sample(value)
+        if sample is not None and not isinstance(sample, str) and field_name is not None:
+            sort_hint = self.session.conventions.get_default_sort_option(type(sample).__name__)
             if sort_hint:
                 field_name = "{0}_Range".format(field_name)
                 if sys.version_info.major > 2:
-                    if value > sys.maxsize:
+                    if sample > sys.maxsize:
                         sort_hint = self.session.conventions.get_default_sort_option("long")
                 self._sort_hints.add("SortHint-{0}={1}".format(field_name, sort_hint))
 
@@ -223,7 +437,7 @@ class Query(object):
         if isinstance(end, timedelta):
             end = Utils.timedelta_tick(end)
 
-        value = start or end
+        value = self._sample(start or end)
         if self.session.conventions.uses_range_type(value) and not field_name.endswith("_Range"):
             sort_hint = self.session.conventions.get_default_sort_option(type(value).__name__)
             if sort_hint:
@@ -243,7 +457,7 @@ class Query(object):
         if isinstance(end, timedelta):
             end = Utils.timedelta_tick(end)
 
-        value = start or end
+        value = self._sample(start or end)
         if self.session.conventions.uses_range_type(value) and not field_name.endswith("_Range"):
             sort_hint = self.session.conventions.get_default_sort_option(type(value).__name__)
             if sort_hint:
@@ -332,30 +546,244 @@ class Query(object):
                 self.query_builder += "^{0}".format(value)
         return self
 
+    def lazily(self):
+        """
+        Execute the query when its results are first needed, together with all the other lazy operations
+        of the session
+
+        @return: the lazy value of the results
+        :rtype: Lazy
+        """
+        self._assert_not_parameterized()
+        return self.session.add_lazy_operation(LazyQueryOperation(self, self._build_index_query(self._cutoff())))
+
+    def compile(self):
+        """
+        Build the query once, to execute it many times with different values.
+        Use QueryParameter(name) in place of the values, e.g.
+        query.where_equals("name", QueryParameter("name")).compile().execute(session, name="test")
+
+        @return: the compiled query, it can be executed by any session of the store
+        :rtype: CompiledQuery
+        """
+        # The cutoff of wait_for_non_stale_results_as_of_now is added when the compiled query is executed
+        path = self.session.database_commands.build_query_path(self.index_name, self._build_index_query(),
+                                                               includes=self.includes)
+        return CompiledQuery(self, path, self._parameters)
+
+    def wait_for_non_stale_results_as_of_now(self, timeout=None):
+        """
+        Wait for the index to be up to date with the documents that were changed before the query
+        (the changes made while we wait do not keep the results stale).
+        The time is taken once when the query is executed and sent with every retry
+
+        @param timeout: the time (in seconds) to wait before the query fails (None for conventions.timeout)
+        :type float
+        """
+        self.wait_for_non_stale_results = True
+        self._wait_as_of_now = True
+        self._wait_timeout = timeout
+        return self
+
+    def wait_for_non_stale_results_as_of(self, cutoff_etag, timeout=None):
+        """
+        Wait for the index to be up to date with the documents up to cutoff_etag
+        (e.g. the etag of a document we just saved)
+
+        @param cutoff_etag: the etag the index has to reach
+        :type str
+        @param timeout: the time (in seconds) to wait before the query fails (None for conventions.timeout)
+        :type float
+        """
+        self.wait_for_non_stale_results = True
+        self._cutoff_etag = cutoff_etag
+        self._wait_timeout = timeout
+        return self
+
+    def show_timings(self, enabled=True):
+        """
+        Get the time every stage of the query took on the server (TimingsInMilliseconds of the statistics,
+        next to the ClientTimingsInMilliseconds of the client)
+        """
+        self._show_timings = enabled
+        return self
+
+    def prefetch(self, enabled=True):
+        """
+        When the query is iterated, get the next page of results in the background while the results
+        of the current page are processed
+        """
+        self._prefetch = enabled
+        return self
+
+    def _cutoff(self):
+        """
+        @return: the cutoff of wait_for_non_stale_results_as_of_now (None when we do not wait as of now)
+        :rtype: datetime
+        """
+        return datetime.utcnow() if self._wait_as_of_now else None
+
+    def _build_index_query(self, cutoff=None):
+        index_query = IndexQuery(self.query_builder, default_operator=self.using_default_operator,
+                                 sort_hints=self._sort_hints, sort_fields=self._sort_fields,
+                                 fetch=self.fetch,
+                                 wait_for_non_stale_results=self.wait_for_non_stale_results,
+                                 cutoff=cutoff, cutoff_etag=self._cutoff_etag, start=self._start,
+                                 show_timings=self._show_timings or
+                                 self.session.conventions.slow_query_threshold is not None)
+        if self._page_size is not None:
+            index_query.page_size = self._page_size
+        if self.wait_for_non_stale_results:
+            index_query.wait_for_non_stale_results_timeout = timedelta(seconds=self._wait_for_stale_timeout)
+        return index_query
+
+    @property
+    def _wait_for_stale_timeout(self):
+        return self.session.conventions.timeout if self._wait_timeout is None else self._wait_timeout
+
+    def count(self):
+        """
+        Count the results of the query without getting them (skip and take are ignored)
+
+        @return: the number of results
+        :rtype: int
+        """
+        self._assert_not_parameterized()
+        self.session.increment_requests_count()
+        response = self._query_response(page_size=0, metadata_only=True)
+        self._record_timings(response, 0)
+        return response["TotalResults"]
+
+    def any(self):
+        """
+        Check if the query has results, only the metadata of one result is sent
+
+        @return: True if the query has at least one result
+        :rtype: bool
+        """
+        self._assert_not_parameterized()
+        self.session.increment_requests_count()
+        response = self._query_response(page_size=1, metadata_only=True)
+        self._record_timings(response, 0)
+        return len(response["Results"]) > 0
+
+    def get_facets(self, facets, start=0, page_size=None):
+        """
+        Count the results of the query by the terms or the ranges of fields, the counts are computed by the server
+        (without getting the results)
+
+        @param facets: The facets to compute, or the key of a stored FacetSetup document
+        :type list of Facet or str
+        @param start: The number of terms to skip in every facet
+        :type int
+        @param page_size: The number of terms of every facet (None for all of them)
+        :type int
+        @return: the values of every facet (the terms or the ranges and their hits) by its name
+        :rtype: dict
+        """
+        self._assert_not_parameterized()
+        self.session.increment_requests_count()
+        if isinstance(facets, str):
+            response = self.session.database_commands.get_facets(self.index_name, self._build_index_query(),
+                                                                 facet_setup_doc=facets, start=start,
+                                                                 page_size=page_size)
+        else:
+            response = self.session.database_commands.get_facets(self.index_name, self._build_index_query(),
+                                                                 facets=facets, start=start, page_size=page_size)
+        return response["Results"]
+
+    def _assert_not_parameterized(self):
+        if self._parameters and self._compiled_path is None:
+            raise InvalidOperationException("A query with parameters has to be compiled and executed with their values")
+
     def _execute_query(self):
+        self._assert_not_parameterized()
         self.session.increment_requests_count()
-        conventions = self.session.conventions
-        end_time = time.time() + conventions.timeout
+        return self._handle_query_response(self._query_response())
+
+    def _query_response(self, start=None, page_size=None, metadata_only=False, cutoff=None):
+        """
+        Send the query (again while the index is stale if we wait for non stale results).
+        The session is not used, so the query can be sent from another thread
+
+        @param start: the start of the page (None for the start of the query)
+        :type int
+        @param page_size: the size of the page (None for the page size of the query)
+        :type int
+        @param metadata_only: True to get only the metadata of the results (without the includes)
+        :type bool
+        @param cutoff: the cutoff of wait_for_non_stale_results_as_of_now (None to take it now)
+        :type datetime
+        @return: the json result of the query (with the time building, sending and parsing it took
+        in ClientTimingsInMilliseconds)
+        :rtype: dict
+        """
+        end_time = time.time() + self._wait_for_stale_timeout
+        delay = _min_stale_delay
+        # Taken once, so the retries of a stale index do not move it forward
+        if cutoff is None:
+            cutoff = self._cutoff()
+        # In seconds, summed over the attempts of a stale index
+        timings = {"Build": 0, "Network": 0, "Parse": 0}
         while True:
-            index_query = IndexQuery(self.query_builder, default_operator=self.using_default_operator,
-                                     sort_hints=self._sort_hints, sort_fields=self._sort_fields,
-                                     fetch=self.fetch,
-                                     wait_for_non_stale_results=self.wait_for_non_stale_results,
-                                     start=self._start)
-            if self._page_size is not None:
-                index_query.page_size = self._page_size
-            response = self.session.database_commands.query(self.index_name, index_query, includes=self.includes)
+            started = time.time()
+            path = self._compiled_path
+            if path is not None and cutoff is not None:
+                path += "&cutOff={0}".format(Utils.quote_key(Utils.datetime_to_string(cutoff) + "Z"))
+            if path is None:
+                index_query = self._build_index_query(cutoff)
+                if start is not None:
+                    index_query.start = start
+                if page_size is not None:
+                    index_query.page_size = page_size
+                path = self.session.database_commands.build_query_path(
+                    self.index_name, index_query, includes=None if metadata_only else self.includes,
+                    metadata_only=metadata_only)
+            timings["Build"] += time.time() - started
+            response = self.session.database_commands.query_by_path(path, timings=timings)
             if response["IsStale"] and self.wait_for_non_stale_results:
-                if time.time() > end_time:
+                remaining = end_time - time.time()
+                if remaining <= 0:
                     raise ErrorResponseException("The index is still stale after reached the timeout")
-                    time.sleep(0.1)
+                # The server returns stale results when it cannot wait (or stops waiting),
+                # backing off keeps the waiting client from flooding it with queries
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, _max_stale_delay)
                 continue
             break
+        response["ClientTimingsInMilliseconds"] = timings
+        return response
 
+    def _record_timings(self, response, convert):
+        """
+        Complete the client timings of the response with the time converting its results took (in seconds)
+        and log the query if it is slow
+        """
+        timings = response.get("ClientTimingsInMilliseconds", None)
+        if timings is None:
+            # A lazy query, its request was sent together with others
+            return
+        timings["Convert"] = convert
+        timings["Total"] = sum(timings[stage] for stage in ("Build", "Network", "Parse", "Convert"))
+        threshold = self.session.conventions.slow_query_threshold
+        slow = threshold is not None and timings["Total"] > threshold
+        for stage in timings:
+            timings[stage] = int(round(timings[stage] * 1000))
+        if slow:
+            _log.warning("Slow query on index %s (%d ms): %s, client timings (ms): %s, server timings (ms): %s",
+                         self.index_name, timings["Total"], self._compiled_path or self.query_builder,
+                         timings, response.get("TimingsInMilliseconds", None))
+
+    def _handle_query_response(self, response):
+        started = time.time()
+        conventions = self.session.conventions
         results = []
         response_results = response.pop("Results")
         response_includes = response.pop("Includes")
 
+        if self.fetch and self._projection != Projection.entity:
+            results = self._project(response_results)
+            response_results = []
         for result in response_results:
             entity, metadata, original_metadata = Utils.convert_to_entity(result, self.object_type, conventions,
                                                                           self.nested_object_types,
@@ -366,10 +794,23 @@ class Query(object):
                                          metadata=metadata, document=result)
             results.append(entity)
         self.session.save_includes(response_includes)
+        if not self.fetch:
+            self.session._mark_used(results)
+        self._record_timings(response, time.time() - started)
         if self._with_statistics:
             return results, response
         return results
 
+    def _project(self, response_results):
+        fields = list(self.fetch)
+        if self._projection == Projection.dict:
+            return [{field: result.get(field, None) for field in fields} for result in response_results]
+        if self._projection == Projection.tuple:
+            return [tuple(result.get(field, None) for field in fields) for result in response_results]
+        # Fields that are not valid python names (e.g. nested fields) get positional names (_0, _1...)
+        row_type = namedtuple("Row", fields, rename=True)
+        return [row_type(*[result.get(field, None) for field in fields]) for result in response_results]
+
 
 class QueryOperator(Enum):
     OR = "OR"
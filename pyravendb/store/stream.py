@@ -0,0 +1,27 @@
+from pyravendb.tools.utils import Utils
+
+
+class StreamResult(object):
+    """
+    A streamed document, the entity is not tracked by the session
+    """
+    __slots__ = ("key", "etag", "metadata", "document")
+
+    def __init__(self, key, etag, metadata, document):
+        self.key = key
+        self.etag = etag
+        self.metadata = metadata
+        self.document = document
+
+
+def convert_results(results, conventions, object_type=None, nested_object_types=None, fetch=False):
+    """
+    @param results: the streamed documents (with their @metadata)
+    :type generator
+    @return: the stream results with the documents converted to entities
+    :rtype: generator
+    """
+    for result in results:
+        entity, metadata, __ = Utils.convert_to_entity(result, object_type, conventions, nested_object_types,
+                                                       fetch=fetch)
+        yield StreamResult(metadata.get("@id", None), metadata.get("@etag", None), metadata, entity)
@@ -0,0 +1,302 @@
+from pyravendb.custom_exceptions import exceptions
+from pyravendb.tools.utils import Utils
+from multiprocessing.pool import ThreadPool
+from threading import Thread, Event, Lock, current_thread
+from datetime import timedelta
+import logging
+import uuid
+
+_log = logging.getLogger(__name__)
+
+
+class SubscriptionBatchOptions(object):
+    def __init__(self, max_doc_count=4096, max_size=None, acknowledgment_timeout=timedelta(minutes=1)):
+        """
+        @param max_doc_count: the maximum number of documents in a batch
+        :type int
+        @param max_size: the maximum size (in bytes) of a batch (None for no limit)
+        :type int
+        @param acknowledgment_timeout: the time the server waits for a batch to be acknowledged before it sends
+        the documents again
+        :type timedelta
+        """
+        self.max_doc_count = max_doc_count
+        self.max_size = max_size
+        self.acknowledgment_timeout = acknowledgment_timeout
+
+    def to_json(self):
+        return {"MaxDocCount": self.max_doc_count, "MaxSize": self.max_size,
+                "AcknowledgmentTimeout": Utils.timedelta_to_str(self.acknowledgment_timeout)}
+
+
+class Subscription(object):
+    """
+    An open subscription: a background thread pulls the batches of documents, hands every document of a batch
+    to the worker (in a thread pool) and acknowledges the batch once the worker finished all of its documents.
+    A batch the worker failed on is not acknowledged and is processed again, so every document is processed
+    at least once. When the subscription is deleted or taken by another subscriber it is closed,
+    the error is in error (and is passed to on_error)
+    """
+
+    def __init__(self, subscriptions, subscription_id, worker, object_type, nested_object_types, batch_options,
+                 workers, on_error, retry_delay, pull_interval, client_alive_interval):
+        self._subscriptions = subscriptions
+        self._requests_handler = subscriptions.document_store._requests_handler
+        self._conventions = subscriptions.document_store.conventions
+        self.subscription_id = subscription_id
+        self.connection_id = str(uuid.uuid4())
+        self._worker = worker
+        self._object_type = object_type
+        self._nested_object_types = nested_object_types
+        self._batch_options = batch_options
+        self._workers = workers
+        self._pool = None
+        self._on_error = on_error
+        self._retry_delay = retry_delay
+        self._pull_interval = pull_interval
+        self._client_alive_interval = client_alive_interval
+        self._closed = Event()
+        self._close_lock = Lock()
+        self._released = False
+        self.error = None
+        self.last_acknowledged_etag = None
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._client_alive_thread = Thread(target=self._client_alive)
+        self._client_alive_thread.daemon = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def is_closed(self):
+        return self._closed.is_set()
+
+    def _path(self, action, **parameters):
+        path = "subscriptions/{0}?id={1}&connection={2}".format(action, self.subscription_id, self.connection_id)
+        for name in parameters:
+            path += "&{0}={1}".format(name, parameters[name])
+        return path
+
+    def _open(self, strategy):
+        options = {"ConnectionId": self.connection_id, "BatchOptions": self._batch_options.to_json(),
+                   "Strategy": strategy, "ClientAliveNotificationInterval":
+                       Utils.timedelta_to_str(timedelta(seconds=self._client_alive_interval)),
+                   "TimeToWaitBeforeConnectionRetry": Utils.timedelta_to_str(timedelta(seconds=self._retry_delay)),
+                   "IgnoreSubscribersErrors": False}
+        response = self._requests_handler.http_request_handler(self._path("open"), "POST", data=options,
+                                                               force_read_from_master=True)
+        self._subscriptions._raise_for_status(response, self.subscription_id)
+        self._pool = ThreadPool(processes=self._workers)
+        self._thread.start()
+        self._client_alive_thread.start()
+
+    def close(self):
+        """
+        Stop pulling documents and release the subscription on the server (the batch that is processed
+        is finished first)
+        """
+        with self._close_lock:
+            if self._released:
+                return
+            self._released = True
+        self._closed.set()
+        for thread in (self._thread, self._client_alive_thread):
+            if thread.ident is not None and thread is not current_thread():
+                thread.join()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+        if self.error is not None:
+            # The subscription is deleted or opened by another subscriber, there is nothing of ours to release
+            return
+        try:
+            self._requests_handler.http_request_handler(self._path("close", force="true"), "POST",
+                                                        force_read_from_master=True)
+        except Exception:
+            _log.exception("Failed to close subscription %s", self.subscription_id)
+
+    def _client_alive(self):
+        # Tells the server the subscriber is alive even while it processes a long batch
+        while not self._closed.wait(self._client_alive_interval / 2.0):
+            try:
+                self._requests_handler.http_request_handler(self._path("client-alive"), "PATCH",
+                                                            force_read_from_master=True)
+            except Exception:
+                _log.exception("Failed to tell the server subscription %s is alive", self.subscription_id)
+
+    def _run(self):
+        batch = None
+        while not self._closed.is_set():
+            try:
+                if batch is None:
+                    batch = self._pull()
+                    if batch is None:
+                        self._closed.wait(self._pull_interval)
+                        continue
+                documents, last_etag = batch
+                self._process(documents)
+                self._acknowledge(last_etag)
+                batch = None
+            except (exceptions.SubscriptionDoesNotExistException, exceptions.SubscriptionInUseException) as e:
+                # Retrying cannot help
+                self.error = e
+                self._closed.set()
+                self._report(e)
+                self.close()
+                return
+            except Exception as e:
+                # The batch is processed again after the delay (a failed pull is sent again)
+                self._report(e)
+                self._closed.wait(self._retry_delay)
+
+    def _pull(self):
+        """
+        @return: the documents of the next batch and the etag to acknowledge, None when there are no new documents
+        :rtype: tuple
+        """
+        response = self._requests_handler.http_request_handler(self._path("pull"), "GET",
+                                                               force_read_from_master=True)
+        self._subscriptions._raise_for_status(response, self.subscription_id)
+        result = response.json()
+        if not result.get("Results", None):
+            return None
+        return result["Results"], result["LastProcessedEtag"]
+
+    def _process(self, documents):
+        entities = []
+        for document in documents:
+            # convert_to_entity takes the metadata out of the document, a copy keeps the batch for a retry
+            entity, __, __ = Utils.convert_to_entity(dict(document), self._object_type, self._conventions,
+                                                     self._nested_object_types)
+            entities.append(entity)
+        # Raises the first error of the worker
+        self._pool.map(self._worker, entities)
+
+    def _acknowledge(self, last_etag):
+        response = self._requests_handler.http_request_handler(self._path("acknowledgeBatch", lastEtag=last_etag),
+                                                               "POST", force_read_from_master=True)
+        self._subscriptions._raise_for_status(response, self.subscription_id)
+        self.last_acknowledged_etag = last_etag
+
+    def _report(self, error):
+        # Called while the error is handled
+        if self._on_error is None:
+            _log.error("Subscription %s failed", self.subscription_id, exc_info=True)
+            return
+        try:
+            self._on_error(error)
+        except Exception:
+            _log.exception("The on_error of subscription %s failed", self.subscription_id)
+
+
+class DocumentSubscriptions(object):
+    """
+    Data subscriptions: the server keeps the position of every subscription and sends the documents that match
+    its criteria in batches, instead of the subscriber querying for new documents
+    """
+
+    def __init__(self, document_store):
+        self.document_store = document_store
+
+    @property
+    def _requests_handler(self):
+        return self.document_store._requests_handler
+
+    @staticmethod
+    def _raise_for_status(response, subscription_id):
+        if response.status_code in (200, 201, 204):
+            return
+        try:
+            error = response.json().get("Error", None)
+        except ValueError:
+            error = None
+        if response.status_code == 404:
+            raise exceptions.SubscriptionDoesNotExistException(
+                "Subscription {0} does not exist".format(subscription_id))
+        if response.status_code == 409:
+            raise exceptions.SubscriptionInUseException(
+                "Subscription {0} is opened by another subscriber".format(subscription_id))
+        raise exceptions.ErrorResponseException(
+            (error or "Subscription request failed with status {0}".format(response.status_code))[:100])
+
+    def create(self, key_starts_with=None, collections=None, properties_match=None, properties_not_match=None,
+               start_etag=None):
+        """
+        @param key_starts_with: send only the documents whose key starts with this prefix
+        :type str
+        @param collections: send only the documents of these collections (Raven-Entity-Name)
+        :type list
+        @param properties_match: send only the documents whose properties have these values
+        :type dict
+        @param properties_not_match: send only the documents whose properties do not have these values
+        :type dict
+        @param start_etag: send the documents that were changed after this etag (None for all of them)
+        :type str
+        @return: the id of the subscription
+        :rtype: int
+        """
+        criteria = {"KeyStartsWith": key_starts_with, "BelongsToAnyCollection": collections,
+                    "PropertiesMatch": properties_match, "PropertiesNotMatch": properties_not_match,
+                    "StartEtag": start_etag}
+        self.document_store._assert_initialize()
+        response = self._requests_handler.http_request_handler("subscriptions/create", "POST", data=criteria,
+                                                               force_read_from_master=True)
+        self._raise_for_status(response, None)
+        return response.json()["Id"]
+
+    def delete(self, subscription_id):
+        self.document_store._assert_initialize()
+        response = self._requests_handler.http_request_handler("subscriptions?id={0}".format(subscription_id),
+                                                               "DELETE", force_read_from_master=True)
+        self._raise_for_status(response, subscription_id)
+
+    def get_subscriptions(self, start=0, page_size=25):
+        """
+        @return: the configurations of the subscriptions of the database
+        :rtype: list
+        """
+        self.document_store._assert_initialize()
+        response = self._requests_handler.http_request_handler(
+            "subscriptions?start={0}&pageSize={1}".format(start, page_size), "GET", force_read_from_master=True)
+        self._raise_for_status(response, None)
+        return response.json()
+
+    def open(self, subscription_id, worker, object_type=None, nested_object_types=None, batch_options=None,
+             workers=4, strategy="OpenIfFree", on_error=None, retry_delay=15, pull_interval=1,
+             client_alive_interval=120):
+        """
+        Open a subscription and start processing its documents
+
+        @param subscription_id: the id create returned
+        :type int
+        @param worker: called with every document of a batch (converted to an entity), in a pool of threads
+        :type function
+        @param object_type: The class we want to get
+        :type classObj:
+        @param batch_options: the size of the batches and the time the server waits for an acknowledgement
+        :type SubscriptionBatchOptions
+        @param workers: the number of threads that process the documents of a batch
+        :type int
+        @param strategy: what to do when another subscriber has the subscription open:
+        OpenIfFree, TakeOver, ForceAndKeep or QueueIn
+        :type str
+        @param on_error: called with the errors of the worker and of the requests
+        (the batch is processed again after retry_delay seconds, unless the subscription was deleted
+        or taken by another subscriber, then the subscription is closed)
+        :type function
+        @param pull_interval: the time (in seconds) we wait for new documents after an empty batch
+        :type float
+        @return: the open subscription, close it to stop processing
+        :rtype: Subscription
+        """
+        self.document_store._assert_initialize()
+        if batch_options is None:
+            batch_options = SubscriptionBatchOptions()
+        subscription = Subscription(self, subscription_id, worker, object_type, nested_object_types, batch_options,
+                                    workers, on_error, retry_delay, pull_interval, client_alive_interval)
+        subscription._open(strategy)
+        return subscription
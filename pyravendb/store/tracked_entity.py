@@ -0,0 +1,375 @@
+from datetime import date, datetime, time, timedelta
+from enum import Enum
+import sys
+
+if sys.version_info.major > 2:
+    _immutable_types = (type(None), bool, int, float, str, bytes, date, datetime, time, timedelta, Enum)
+else:
+    _immutable_types = (type(None), bool, int, long, float, str, unicode, date, datetime, time, timedelta, Enum)
+
+# The attribute name we report when the metadata of the entity changes
+METADATA = "@metadata"
+
+
+class _TrackingState(object):
+    __slots__ = ["on_change", "dirty_attributes", "trackable", "owners"]
+
+    def __init__(self):
+        self.on_change = None
+        self.dirty_attributes = set()
+        self.trackable = True
+        # (owner, attribute) for every place that holds the entity
+        self.owners = []
+
+
+class TrackedEntity(object):
+    """
+    Base class (or mixin) for entities that record their own changes.
+
+    The session does not need to compare a tracked entity with its original document in save_changes,
+    it only visits the entities that were changed since they were loaded (or last saved).
+    Assigning or deleting an attribute and changing a TrackedList or a TrackedDict held by the entity
+    (at any depth) are recorded, and so are changes to nested TrackedEntity objects.
+    The lists and dicts of a loaded entity are tracked ones, a plain list or dict that is assigned is kept
+    as it is (so changes through other references to it still count) and the entity falls back
+    to the regular comparison, as it does for any other mutable object it holds.
+    """
+    __slots__ = ["_tracking_state", "__dict__", "__weakref__"]
+
+    def __new__(cls, *args, **kwargs):
+        entity = super(TrackedEntity, cls).__new__(cls)
+        object.__setattr__(entity, "_tracking_state", _TrackingState())
+        return entity
+
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            _untrack(self.__dict__[name], self, name)
+        super(TrackedEntity, self).__setattr__(name, _track(value, self, name))
+        _mark_dirty(self, name)
+
+    def __delattr__(self, name):
+        value = self.__dict__.get(name, None)
+        super(TrackedEntity, self).__delattr__(name)
+        _untrack(value, self, name)
+        _mark_dirty(self, name)
+
+    def __getstate__(self):
+        # A copy gets a tracking state of its own
+        return self.__dict__
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            super(TrackedEntity, self).__setattr__(name, _track(value, self, name))
+
+
+class TrackedList(list):
+    """
+    A list that reports its changes to the entities (and containers) that hold it.
+    The same list can be held by several entities, a change is reported to all of them
+    """
+    __slots__ = ["_owners"]
+
+    def __init__(self, iterable=()):
+        self._owners = []
+        super(TrackedList, self).__init__(iterable)
+        for item in self:
+            _track(item, self, None)
+
+    def _changed(self):
+        _mark_dirty(self, None)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+            removed = self[index]
+        else:
+            removed = [self[index]]
+        super(TrackedList, self).__setitem__(index, value)
+        for item in removed:
+            _untrack(item, self, None)
+        for item in (value if isinstance(index, slice) else [value]):
+            _track(item, self, None)
+        self._changed()
+
+    def __delitem__(self, index):
+        removed = self[index] if isinstance(index, slice) else [self[index]]
+        super(TrackedList, self).__delitem__(index)
+        for item in removed:
+            _untrack(item, self, None)
+        self._changed()
+
+    def __setslice__(self, i, j, sequence):
+        # python 2 only
+        self.__setitem__(slice(i, j), sequence)
+
+    def __delslice__(self, i, j):
+        # python 2 only
+        self.__delitem__(slice(i, j))
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __imul__(self, count):
+        items = list(self)
+        super(TrackedList, self).__imul__(count)
+        for item in items:
+            _untrack(item, self, None)
+        for item in self:
+            _track(item, self, None)
+        self._changed()
+        return self
+
+    def append(self, value):
+        super(TrackedList, self).append(value)
+        _track(value, self, None)
+        self._changed()
+
+    def extend(self, iterable):
+        items = list(iterable)
+        super(TrackedList, self).extend(items)
+        for item in items:
+            _track(item, self, None)
+        self._changed()
+
+    def insert(self, index, value):
+        super(TrackedList, self).insert(index, value)
+        _track(value, self, None)
+        self._changed()
+
+    def pop(self, *args):
+        value = super(TrackedList, self).pop(*args)
+        _untrack(value, self, None)
+        self._changed()
+        return value
+
+    def remove(self, value):
+        del self[self.index(value)]
+
+    def clear(self):
+        del self[:]
+
+    def sort(self, *args, **kwargs):
+        super(TrackedList, self).sort(*args, **kwargs)
+        self._changed()
+
+    def reverse(self):
+        super(TrackedList, self).reverse()
+        self._changed()
+
+    def __reduce__(self):
+        # A copy is a new list that is not held by anything yet
+        return TrackedList, (list(self),)
+
+
+class TrackedDict(dict):
+    """
+    A dict that reports its changes to the entities (and containers) that hold it.
+    The same dict can be held by several entities, a change is reported to all of them
+    """
+    __slots__ = ["_owners"]
+
+    def __init__(self, mapping=()):
+        self._owners = []
+        super(TrackedDict, self).__init__(mapping)
+        for value in self.values():
+            _track(value, self, None)
+
+    def _changed(self):
+        _mark_dirty(self, None)
+
+    def __setitem__(self, key, value):
+        if key in self:
+            _untrack(self[key], self, None)
+        super(TrackedDict, self).__setitem__(key, value)
+        _track(value, self, None)
+        self._changed()
+
+    def __delitem__(self, key):
+        value = self[key]
+        super(TrackedDict, self).__delitem__(key)
+        _untrack(value, self, None)
+        self._changed()
+
+    def pop(self, key, *args):
+        if key not in self:
+            return super(TrackedDict, self).pop(key, *args)
+        value = super(TrackedDict, self).pop(key)
+        _untrack(value, self, None)
+        self._changed()
+        return value
+
+    def popitem(self):
+        item = super(TrackedDict, self).popitem()
+        _untrack(item[1], self, None)
+        self._changed()
+        return item
+
+    def clear(self):
+        values = list(self.values())
+        super(TrackedDict, self).clear()
+        for value in values:
+            _untrack(value, self, None)
+        self._changed()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            if key in self:
+                _untrack(self[key], self, None)
+            super(TrackedDict, self).__setitem__(key, value)
+            _track(value, self, None)
+        self._changed()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __reduce__(self):
+        # A copy is a new dict that is not held by anything yet
+        return TrackedDict, (dict(self),)
+
+
+def _owners_of(value):
+    if isinstance(value, (TrackedList, TrackedDict)):
+        return value._owners
+    if isinstance(value, TrackedEntity):
+        return value._tracking_state.owners
+    return None
+
+
+def _track(value, owner, owner_attribute):
+    """
+    Link the tracked lists, dicts and entities to the owner (in place, they are never copied)
+    so they report their changes to it
+    """
+    owners = _owners_of(value)
+    if owners is not None:
+        owners.append((owner, owner_attribute))
+    if not _is_trackable(value):
+        _mark_untrackable(owner)
+    return value
+
+
+def _untrack(value, owner, owner_attribute):
+    owners = _owners_of(value)
+    if owners is None:
+        return
+    for i, (current_owner, current_attribute) in enumerate(owners):
+        # the owner is compared by identity, two equal lists are still different owners
+        if current_owner is owner and current_attribute == owner_attribute:
+            del owners[i]
+            return
+
+
+def _mark_untrackable(owner):
+    if isinstance(owner, TrackedEntity):
+        state = owner._tracking_state
+        if not state.trackable:
+            return
+        state.trackable = False
+    for parent, __ in _owners_of(owner):
+        _mark_untrackable(parent)
+
+
+def _mark_dirty(owner, attribute):
+    if isinstance(owner, TrackedEntity):
+        state = owner._tracking_state
+        state.dirty_attributes.add(attribute)
+        if state.on_change is not None:
+            state.on_change(owner)
+        owners = state.owners
+    else:
+        owners = owner._owners
+    # An entity reports the attribute it is held in to its owner (a container reports the one it is held in)
+    for parent, parent_attribute in owners:
+        _mark_dirty(parent, parent_attribute)
+
+
+def _is_trackable(value):
+    if isinstance(value, _immutable_types):
+        return True
+    if isinstance(value, TrackedList):
+        return all(_is_trackable(item) for item in value)
+    if isinstance(value, TrackedDict):
+        return all(_is_trackable(item) for item in value.values())
+    if isinstance(value, TrackedEntity):
+        return value._tracking_state.trackable
+    if isinstance(value, tuple):
+        return all(_is_trackable(item) for item in value)
+    return False
+
+
+def _track_document_value(value):
+    if type(value) is list:
+        return TrackedList(_track_document_value(item) for item in value)
+    if type(value) is dict:
+        return TrackedDict((key, _track_document_value(item)) for key, item in value.items())
+    if isinstance(value, TrackedEntity):
+        track_loaded_entity(value)
+    return value
+
+
+def track_loaded_entity(entity):
+    """
+    Replace the lists and dicts of an entity that was just built from a document with tracked ones.
+    Nothing else holds them yet, so (unlike the ones that are assigned later) they can be copied
+
+    @param entity: the entity that was built from the document
+    :type TrackedEntity
+    """
+    state = entity._tracking_state
+    state.trackable = True
+    for name, value in list(entity.__dict__.items()):
+        _untrack(value, entity, name)
+        object.__setattr__(entity, name, _track(_track_document_value(value), entity, name))
+    state.dirty_attributes.clear()
+
+
+def start_tracking(entity, on_change):
+    """
+    @param entity: the entity we want to record the changes of
+    :type TrackedEntity
+    @param on_change: called with the entity on every change
+    :type function
+    @return: False if the entity holds values that we cannot record the changes of
+    :rtype: bool
+    """
+    state = entity._tracking_state
+    state.on_change = on_change
+    state.dirty_attributes.clear()
+    return state.trackable
+
+
+def stop_tracking(entity):
+    entity._tracking_state.on_change = None
+
+
+def clear_changes(entity):
+    """
+    Forget the recorded changes (after the entity was saved)
+
+    @return: False if the entity now holds values that we cannot record the changes of
+    :rtype: bool
+    """
+    state = entity._tracking_state
+    state.dirty_attributes.clear()
+    return state.trackable
+
+
+def get_dirty_attributes(entity):
+    """
+    @return: the names of the attributes that were changed since the entity was loaded or saved
+    (METADATA for the metadata)
+    :rtype: set
+    """
+    return entity._tracking_state.dirty_attributes
+
+
+def track_metadata(entity, metadata):
+    # The metadata is a copy the session made, so it can be replaced with a tracked one
+    return _track(_track_document_value(metadata), entity, METADATA)
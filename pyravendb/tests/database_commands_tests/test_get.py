@@ -1,6 +1,8 @@
 import unittest
+from threading import Thread
 
 from pyravendb.tests.test_base import TestBase
+from pyravendb.d_commands.batching_loader import BatchingLoader
 
 
 class TestGet(TestBase):
@@ -22,6 +24,25 @@ class TestGet(TestBase):
     def test_null(self):
         self.assertIsNone(self.db.get("product")["Results"][0])
 
+    def test_batched_gets(self):
+        self.db.batching_loader = BatchingLoader(self.db, 0.05)
+        responses = {}
+
+        def get(key):
+            responses[key] = self.db.get(key)
+
+        try:
+            threads = [Thread(target=get, args=(key,)) for key in ("products/101", "products/10", "product")]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            self.db.batching_loader = None
+        self.assertEqual(responses["products/101"]["Results"][0]["@metadata"]["@id"], "products/101")
+        self.assertEqual(responses["products/10"]["Results"][0]["@metadata"]["@id"], "products/10")
+        self.assertIsNone(responses["product"]["Results"][0])
+
 
 if __name__ == "__main__":
     unittest.main()
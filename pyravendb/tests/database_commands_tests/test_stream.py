@@ -0,0 +1,28 @@
+import unittest
+
+from pyravendb.tests.test_base import TestBase
+
+
+class TestStream(TestBase):
+    @classmethod
+    def setUpClass(cls):
+        super(TestStream, cls).setUpClass()
+        for i in range(10):
+            cls.db.put("streamed/{0}".format(i), {"Name": "test{0}".format(i)}, {})
+
+    def test_stream_docs_starts_with(self):
+        results = list(self.db.stream_docs(starts_with="streamed/"))
+        self.assertEqual(sorted(result["@metadata"]["@id"] for result in results),
+                         ["streamed/{0}".format(i) for i in range(10)])
+
+    def test_resume_stream_docs_by_etag(self):
+        first = list(self.db.stream_docs(page_size=3))
+        self.assertEqual(len(first), 3)
+        rest = list(self.db.stream_docs(from_etag=first[-1]["@metadata"]["@etag"]))
+        keys = [result["@metadata"]["@id"] for result in first + rest]
+        self.assertEqual(len(keys), len(set(keys)))
+        self.assertTrue(all("streamed/{0}".format(i) in keys for i in range(10)))
+
+
+if __name__ == "__main__":
+    unittest.main()
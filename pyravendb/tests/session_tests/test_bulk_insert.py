@@ -0,0 +1,35 @@
+from pyravendb.tests.test_base import TestBase
+from pyravendb.store.document_store import documentstore
+import unittest
+
+
+class User(object):
+    def __init__(self, name, age=None):
+        self.name = name
+        self.age = age
+
+
+class TestBulkInsert(TestBase):
+    @classmethod
+    def setUpClass(cls):
+        super(TestBulkInsert, cls).setUpClass()
+        cls.document_store = documentstore(cls.default_url, cls.default_database)
+        cls.document_store.initialize()
+
+    def test_bulk_insert(self):
+        keys = []
+        with self.document_store.bulk_insert(batch_size=64) as bulk_insert:
+            for i in range(1000):
+                keys.append(bulk_insert.store(User("user{0}".format(i), i)))
+            keys.append(bulk_insert.store({"name": "raw"}, metadata={"Raven-Entity-Name": "Users"}))
+
+        with self.document_store.open_session() as session:
+            users = session.load(keys)
+            self.assertTrue(all(user is not None for user in users))
+            self.assertEqual(users[10].name, "user10")
+            self.assertTrue(isinstance(users[10], User))
+            self.assertEqual(users[-1].name, "raw")
+
+
+if __name__ == "__main__":
+    unittest.main()
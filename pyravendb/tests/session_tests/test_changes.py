@@ -0,0 +1,55 @@
+from pyravendb.tests.test_base import TestBase
+from pyravendb.store.document_store import documentstore
+from pyravendb.store.changes import DatabaseChanges
+from pyravendb.connection.requests_factory import HttpRequestsFactory
+from threading import Event
+import unittest
+
+
+class TestChanges(TestBase):
+    @classmethod
+    def setUpClass(cls):
+        super(TestChanges, cls).setUpClass()
+        cls.document_store = documentstore(cls.default_url, cls.default_database)
+        cls.document_store.initialize()
+
+    def test_document_change_notification(self):
+        changes = self.document_store.changes()
+        self.assertTrue(changes.connected.wait(10))
+        notified = Event()
+        notifications = []
+
+        def on_change(value):
+            notifications.append(value)
+            notified.set()
+
+        subscription = changes.for_document("watched/1").subscribe(on_change)
+        try:
+            self.db.put("watched/2", {"name": "other"}, {})
+            self.db.put("watched/1", {"name": "test"}, {})
+            self.assertTrue(notified.wait(10))
+            self.assertEqual(notifications[0]["Id"], "watched/1")
+            self.assertEqual(notifications[0]["Type"], "Put")
+        finally:
+            subscription.close()
+            changes.close()
+
+    def test_give_up_reconnecting(self):
+        # Nothing listens on this port
+        changes = DatabaseChanges(HttpRequestsFactory("http://localhost:1", self.default_database),
+                                  reconnect_delay=0.2, max_reconnect_attempts=3)
+        failed = Event()
+        errors = []
+
+        def on_error(error):
+            errors.append(error)
+            failed.set()
+
+        changes.for_all_documents().subscribe(lambda value: None, on_error)
+        self.assertTrue(failed.wait(10))
+        self.assertIs(errors[0], changes.error)
+        self.assertFalse(changes.connected.is_set())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+from pyravendb.tests.test_base import TestBase, RequestsCounter
+from pyravendb.store.document_store import documentstore
+from pyravendb.custom_exceptions import exceptions
+import unittest
+
+
+class Product(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class TestLazy(TestBase):
+    @classmethod
+    def setUpClass(cls):
+        super(TestLazy, cls).setUpClass()
+        for i in range(1, 4):
+            cls.db.put("products/{0}".format(i), {"name": "test{0}".format(i)},
+                       {"Raven-Python-Type": Product.__module__ + ".Product", "Raven-Entity-Name": "Products"})
+        cls.document_store = documentstore(cls.default_url, cls.default_database)
+        cls.document_store.initialize()
+        # The index of the query is created (and caught up) before the tests count the requests
+        with cls.document_store.open_session() as session:
+            list(session.query(object_type=Product, wait_for_non_stale_results=True).where_equals("name", "test1"))
+
+    def test_lazy_operations_in_one_request(self):
+        with self.document_store.open_session() as session:
+            with RequestsCounter() as counter:
+                product = session.advanced.lazily.load("products/1", object_type=Product)
+                products = session.advanced.lazily.load(["products/2", "products/3", "products/4"],
+                                                        object_type=Product)
+                results = session.query(object_type=Product, wait_for_non_stale_results=True).where_equals(
+                    "name", "test1").lazily()
+                self.assertEqual(counter.count, 0)
+                self.assertEqual(product.value.name, "test1")
+                self.assertEqual([p.name if p else None for p in products.value], ["test2", "test3", None])
+                self.assertEqual([p.name for p in results.value], ["test1"])
+                self.assertEqual(counter.count, 1)
+            self.assertEqual(session.advanced.number_of_requests_in_session(), 1)
+
+    def test_lazy_load_of_a_loaded_document(self):
+        with self.document_store.open_session() as session:
+            product = session.load("products/1")
+            with RequestsCounter() as counter:
+                lazy_product = session.advanced.lazily.load("products/1")
+                self.assertIs(lazy_product.value, product)
+                self.assertEqual(counter.count, 0)
+
+    def test_lazy_query_of_a_missing_index(self):
+        with self.document_store.open_session() as session:
+            results = session.query(index_name="MissingIndex").where_equals("name", "test1").lazily()
+            with self.assertRaises(exceptions.ErrorResponseException):
+                results.value
+
+    def test_lazy_load_after_a_failed_lazy_query(self):
+        with self.document_store.open_session() as session:
+            results = session.query(index_name="MissingIndex").where_equals("name", "test1").lazily()
+            product = session.advanced.lazily.load("products/1", object_type=Product)
+            with self.assertRaises(exceptions.ErrorResponseException):
+                results.value
+            self.assertEqual(product.value.name, "test1")
+            with self.assertRaises(exceptions.ErrorResponseException):
+                results.value
+
+
+if __name__ == "__main__":
+    unittest.main()
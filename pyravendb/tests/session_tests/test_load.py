@@ -86,6 +86,32 @@ class TestLoad(TestBase):
             session.load("products/101")
         self.assertEqual(session.number_of_requests_in_session, 1)
 
+    def test_evict_and_clear(self):
+        with self.document_store.open_session() as session:
+            product = session.load("products/101")
+            session.advanced.evict(product)
+            self.assertNotIn(product, session.entities_and_metadata)
+            self.assertIsNot(session.load("products/101"), product)
+            session.load("products/10")
+            session.advanced.clear()
+            self.assertEqual(len(session.entities_and_metadata), 0)
+            self.assertEqual(session.number_of_requests_in_session, 3)
+
+    def test_load_without_tracking(self):
+        with self.document_store.open_session(no_tracking=True) as session:
+            product = session.load("products/101")
+            self.assertTrue(isinstance(product, Product))
+            self.assertIsNot(session.load("products/101"), product)
+            self.assertEqual(len(session.entities_and_metadata), 0)
+            # The included documents are not kept either, loading one goes to the server again
+            session.load("orders/105", includes="product")
+            session.load("products/101")
+            self.assertEqual(session.number_of_requests_in_session, 4)
+            with self.assertRaises(exceptions.InvalidOperationException):
+                session.store(product)
+            with self.assertRaises(exceptions.InvalidOperationException):
+                session.save_changes()
+
 
 if __name__ == "__main__":
     unittest.main()
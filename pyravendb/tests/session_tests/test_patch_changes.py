@@ -0,0 +1,41 @@
+from pyravendb.tests.test_base import TestBase
+from pyravendb.store.document_store import documentstore
+import unittest
+
+
+class Company(object):
+    def __init__(self, name, address=None, phone=None):
+        self.name = name
+        self.address = address
+        self.phone = phone
+
+
+class TestPatchChanges(TestBase):
+    @classmethod
+    def setUpClass(cls):
+        super(TestPatchChanges, cls).setUpClass()
+        cls.db.put("companies/1", {"name": "test", "address": "a" * 1000, "phone": "123"},
+                   {"Raven-Python-Type": Company.__module__ + ".Company"})
+        cls.document_store = documentstore(cls.default_url, cls.default_database)
+        cls.document_store.initialize()
+
+    def test_save_changed_fields_with_patch(self):
+        with self.document_store.open_session() as session:
+            session.advanced.use_patches_for_changes = True
+            company = session.load("companies/1", object_type=Company)
+            company.name = "patched"
+            del company.phone
+            patch = session._build_patch(company)
+            self.assertEqual(sorted(field for name, field in patch.values.items() if name.startswith("field")),
+                             ["name", "phone"])
+            session.save_changes()
+
+        with self.document_store.open_session() as session:
+            company = session.load("companies/1", object_type=Company)
+            self.assertEqual(company.name, "patched")
+            self.assertEqual(company.address, "a" * 1000)
+            self.assertIsNone(company.phone)
+
+
+if __name__ == "__main__":
+    unittest.main()
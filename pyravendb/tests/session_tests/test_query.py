@@ -1,8 +1,9 @@
-from pyravendb.tests.test_base import TestBase
+from pyravendb.tests.test_base import TestBase, RequestsCounter
 from pyravendb.store.document_store import documentstore
-from pyravendb.store.session_query import QueryOperator
+from pyravendb.store.session_query import QueryOperator, QueryParameter, Projection
 from pyravendb.custom_exceptions import exceptions
 from pyravendb.data.indexes import IndexDefinition, SortOptions
+from pyravendb.data.facets import Facet
 import unittest
 
 
@@ -193,5 +194,111 @@ class TestQuery(TestBase):
             query_result = list(session.query().where_starts_with("name", "test").take(4).skip("2"))
             self.assertEqual(len(query_result), 4)
 
+    def test_compiled_query(self):
+        with self.document_store.open_session() as session:
+            compiled = session.query(index_name="Testing_Sort", wait_for_non_stale_results=True).where_equals(
+                "name", QueryParameter("name")).compile()
+        for name, count in (("test107", 2), ("test10", 1), ("missing", 0)):
+            with self.document_store.open_session() as session:
+                self.assertEqual(len(compiled.execute(session, name=name)), count)
+
+    def test_parameterized_query_has_to_be_compiled(self):
+        with self.document_store.open_session() as session:
+            query = session.query(index_name="Testing_Sort").where_equals("name", QueryParameter("name"))
+            with RequestsCounter() as counter:
+                with self.assertRaises(exceptions.InvalidOperationException):
+                    query.lazily()
+                with self.assertRaises(exceptions.InvalidOperationException):
+                    session.advanced.stream(query)
+                self.assertEqual(counter.count, 0)
+
+    def test_query_timings(self):
+        with self.document_store.open_session() as session:
+            query_result, statistics = session.query(index_name="Testing_Sort", wait_for_non_stale_results=True,
+                                                     with_statistics=True).where_equals(
+                "name", "test107").show_timings()
+            self.assertEqual(len(query_result), 2)
+            self.assertEqual(set(statistics["ClientTimingsInMilliseconds"]),
+                             {"Build", "Network", "Parse", "Convert", "Total"})
+            self.assertIn("TimingsInMilliseconds", statistics)
+
+    def test_get_facets(self):
+        with self.document_store.open_session() as session:
+            facets = session.query(index_name="Testing_Sort", wait_for_non_stale_results=True).where_starts_with(
+                "name", "test1").get_facets([Facet("name"), Facet("key_Range", [Facet.range(None, 4),
+                                                                                Facet.range(5, None)])])
+            self.assertEqual({value["Range"]: value["Hits"] for value in facets["name"]["Values"]},
+                             {"test101": 1, "test10": 1, "test106": 1, "test107": 2})
+            self.assertEqual([value["Hits"] for value in facets["key_Range"]["Values"]], [3, 2])
+
+    def test_facet_range_encodes_every_number_as_double(self):
+        self.assertEqual(Facet.range(None, 4), "[NULL TO Dx4]")
+        self.assertEqual(Facet.range(0.5, 2 ** 62), "[Dx0.5 TO Dx{0}]".format(2 ** 62))
+        self.assertEqual(Facet.range(False, True), "[false TO true]")
+
+    def test_count_and_any(self):
+        with self.document_store.open_session() as session:
+            self.assertEqual(session.query(index_name="Testing_Sort", wait_for_non_stale_results=True).where_equals(
+                "name", "test107").count(), 2)
+            self.assertTrue(session.query(index_name="Testing_Sort").where_equals("name", "test10").any())
+            self.assertFalse(session.query(index_name="Testing_Sort").where_equals("name", "missing").any())
+            self.assertEqual(len(session.entities_and_metadata), 0)
+
+    def test_select_with_projection(self):
+        with self.document_store.open_session() as session:
+            query_result = list(session.query(index_name="Testing_Sort", wait_for_non_stale_results=True).where_equals(
+                "name", "test10").select("name", "key", projection=Projection.named_tuple))
+            self.assertEqual([(row.name, row.key) for row in query_result], [("test10", 3)])
+            query_result = list(session.query(index_name="Testing_Sort").where_equals("name", "test10").select(
+                "name", projection=Projection.dict))
+            self.assertEqual(query_result, [{"name": "test10"}])
+            self.assertEqual(len(session.entities_and_metadata), 0)
+
+    def test_wait_for_non_stale_results_as_of_now(self):
+        with self.document_store.open_session() as session:
+            query_result = list(session.query(index_name="Testing_Sort").where_equals(
+                "name", "test107").wait_for_non_stale_results_as_of_now(timeout=10))
+            self.assertEqual(len(query_result), 2)
+
+    def test_query_pages_with_prefetch(self):
+        with self.document_store.open_session() as session:
+            expected = len(list(session.query(wait_for_non_stale_results=True).where_starts_with("name", "test")))
+        self.document_store.conventions.query_page_size = 2
+        try:
+            with self.document_store.open_session() as session:
+                with RequestsCounter() as counter:
+                    query_result = list(session.query(wait_for_non_stale_results=True).where_starts_with(
+                        "name", "test").prefetch())
+                self.assertEqual(len(query_result), expected)
+                self.assertGreater(counter.count, 1)
+                self.assertEqual(session.number_of_requests_in_session, 1)
+        finally:
+            self.document_store.conventions.query_page_size = 128
+
+    def test_query_pages_over_the_requests_limit(self):
+        with self.document_store.open_session() as session:
+            expected = len(list(session.query(wait_for_non_stale_results=True).where_starts_with("name", "test")))
+        # Every result is a page of its own, so there are more pages than requests a session may make
+        self.document_store.conventions.query_page_size = 1
+        self.document_store.conventions.max_number_of_request_per_session = 2
+        try:
+            with self.document_store.open_session() as session:
+                query_result = list(session.query(wait_for_non_stale_results=True).where_starts_with("name", "test"))
+                self.assertEqual(len(query_result), expected)
+                self.assertGreater(expected, 2)
+        finally:
+            self.document_store.conventions.query_page_size = 128
+            self.document_store.conventions.max_number_of_request_per_session = 30
+
+    def test_stream_query(self):
+        with self.document_store.open_session() as session:
+            # Wait for the index before streaming it
+            list(session.query(index_name="Testing_Sort", wait_for_non_stale_results=True).where(key=[4, 6, 90]))
+            results = list(session.advanced.stream(
+                session.query(object_type=Product, index_name="Testing_Sort").where(key=[4, 6, 90])))
+            self.assertEqual(sorted(result.key for result in results), ["products/103", "products/106", "products/108"])
+            self.assertTrue(all(isinstance(result.document, Product) for result in results))
+            self.assertEqual(len(session.entities_and_metadata), 0)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,65 @@
+from pyravendb.tests.test_base import TestBase
+from pyravendb.store.document_store import documentstore
+from pyravendb.data.document_convention import SnapshotMode
+import unittest
+
+
+class Product(object):
+    def __init__(self, name, tags=None, Id=None):
+        self.name = name
+        self.tags = tags
+        self.Id = Id
+
+
+class TestSnapshotMode(TestBase):
+    @classmethod
+    def setUpClass(cls):
+        super(TestSnapshotMode, cls).setUpClass()
+        for i in range(10):
+            cls.db.put("products/{0}".format(i), {"name": "test", "tags": [i]},
+                       {"Raven-Python-Type": Product.__module__ + ".Product"})
+        cls.document_store = documentstore(cls.default_url, cls.default_database)
+        cls.document_store.initialize()
+
+    def tearDown(self):
+        self.document_store.conventions.snapshot_mode = SnapshotMode.serialized
+        self.document_store.conventions.max_tracked_entities = None
+
+    def _assert_only_changed_entity_saved(self):
+        with self.document_store.open_session() as session:
+            products = session.load(["products/{0}".format(i) for i in range(10)], object_type=Product)
+            session.save_changes()
+            self.assertEqual(session.advanced.number_of_requests_in_session(), 1)
+            products[3].tags.append(10)
+            self.assertEqual([entity for entity in session._entities_to_check() if session._has_change(entity)],
+                             [products[3]])
+            session.save_changes()
+            self.assertEqual(session.advanced.number_of_requests_in_session(), 2)
+
+    def test_serialized_snapshots(self):
+        self._assert_only_changed_entity_saved()
+
+    def test_hashed_snapshots(self):
+        self.document_store.conventions.snapshot_mode = SnapshotMode.hashed
+        self._assert_only_changed_entity_saved()
+
+    def test_memory_usage(self):
+        with self.document_store.open_session() as session:
+            session.load(["products/{0}".format(i) for i in range(10)], object_type=Product)
+            usage = session.advanced.memory_usage()
+            self.assertEqual(usage["documents"], 10)
+            self.assertEqual(usage["total"], usage["entities"] + usage["snapshots"] + usage["metadata"])
+
+    def test_max_tracked_entities(self):
+        self.document_store.conventions.max_tracked_entities = 5
+        with self.document_store.open_session() as session:
+            products = session.load(["products/{0}".format(i) for i in range(5)], object_type=Product)
+            products[0].name = "changed"
+            session.load(["products/{0}".format(i) for i in range(5, 10)], object_type=Product)
+            self.assertEqual(len(session.entities_and_metadata), 5)
+            self.assertIn(products[0], session.entities_and_metadata)
+            self.assertNotIn(products[1], session.entities_and_metadata)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,4 @@
-from pyravendb.tests.test_base import TestBase
+from pyravendb.tests.test_base import TestBase, RequestsCounter
 from pyravendb.store.document_store import documentstore
 from pyravendb.custom_exceptions import exceptions
 import unittest
@@ -47,6 +47,40 @@ class TestSessionStore(TestBase):
             with self.assertRaises(exceptions.InvalidOperationException):
                 session.store(foo)
 
+    def test_store_with_generated_ids(self):
+        keys = self.document_store.generate_ids(Foo, 50)
+        self.assertEqual(len(set(keys)), 50)
+        with self.document_store.open_session() as session:
+            for i in range(50):
+                session.store(Foo("test", i), keys[i])
+            session.save_changes()
+
+        with self.document_store.open_session() as session:
+            self.assertEqual(session.load(keys[49]).key, 49)
+
+    def test_generate_ids_for_several_collections(self):
+        keys = self.document_store.generate_ids({Foo: 10, "Bars": 5})
+        self.assertEqual(len(keys[Foo]), 10)
+        self.assertTrue(all(key.startswith("Bars/") for key in keys["Bars"]))
+        self.assertNotIn(self.document_store.generate_id(Foo("test", 1)), keys[Foo])
+
+    def test_save_changes_in_batches(self):
+        self.document_store.conventions.save_changes_batch_size = 10
+        try:
+            with self.document_store.open_session() as session:
+                for i in range(45):
+                    session.store(Foo("test", i), "batchedFoos/{0}".format(i))
+                with RequestsCounter() as counter:
+                    session.save_changes(transactional=False)
+                self.assertEqual(counter.count, 5)
+                self.assertEqual(session.advanced.number_of_requests_in_session(), 1)
+        finally:
+            self.document_store.conventions.save_changes_batch_size = 1024
+
+        with self.document_store.open_session() as session:
+            foos = session.load(["batchedFoos/{0}".format(i) for i in range(45)])
+            self.assertEqual([foo.key for foo in foos], list(range(45)))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,59 @@
+from pyravendb.tests.test_base import TestBase
+from pyravendb.store.document_store import documentstore
+from pyravendb.custom_exceptions import exceptions
+from threading import Event, Lock
+import unittest
+
+
+class TestSubscriptions(TestBase):
+    @classmethod
+    def setUpClass(cls):
+        super(TestSubscriptions, cls).setUpClass()
+        for i in range(10):
+            cls.db.put("subscribed/{0}".format(i), {"name": "test{0}".format(i)}, {"Raven-Entity-Name": "Subscribed"})
+        cls.document_store = documentstore(cls.default_url, cls.default_database)
+        cls.document_store.initialize()
+
+    def test_subscription_processes_all_documents(self):
+        subscription_id = self.document_store.subscriptions.create(collections=["Subscribed"])
+        names = set()
+        lock = Lock()
+        done = Event()
+
+        def worker(entity):
+            with lock:
+                names.add(entity.name)
+                if len(names) == 10:
+                    done.set()
+
+        with self.document_store.subscriptions.open(subscription_id, worker) as subscription:
+            self.assertTrue(done.wait(30))
+            with self.assertRaises(exceptions.SubscriptionInUseException):
+                self.document_store.subscriptions.open(subscription_id, worker)
+        self.assertEqual(names, set("test{0}".format(i) for i in range(10)))
+        self.assertIsNotNone(subscription.last_acknowledged_etag)
+        self.document_store.subscriptions.delete(subscription_id)
+
+    def test_subscription_closes_when_deleted(self):
+        subscription_id = self.document_store.subscriptions.create(collections=["Subscribed"])
+        failed = Event()
+        errors = []
+
+        def on_error(error):
+            errors.append(error)
+            failed.set()
+
+        subscription = self.document_store.subscriptions.open(subscription_id, lambda entity: None,
+                                                              on_error=on_error, retry_delay=1)
+        try:
+            self.document_store.subscriptions.delete(subscription_id)
+            self.assertTrue(failed.wait(30))
+            self.assertIsInstance(errors[0], exceptions.SubscriptionDoesNotExistException)
+            self.assertTrue(subscription.is_closed)
+            self.assertIs(subscription.error, errors[0])
+        finally:
+            subscription.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+from pyravendb.tests.test_base import TestBase
+from pyravendb.store.document_store import documentstore
+from pyravendb.store.tracked_entity import TrackedEntity, TrackedList, TrackedDict
+import unittest
+
+
+class Order(TrackedEntity):
+    def __init__(self, name, lines=None):
+        self.name = name
+        self.lines = lines if lines is not None else []
+
+
+class TestTrackedEntity(TestBase):
+    @classmethod
+    def setUpClass(cls):
+        super(TestTrackedEntity, cls).setUpClass()
+        cls.db.put("orders/1", {"name": "first", "lines": [1, 2]},
+                   {"Raven-Python-Type": Order.__module__ + ".Order"})
+        cls.db.put("orders/2", {"name": "second", "lines": []},
+                   {"Raven-Python-Type": Order.__module__ + ".Order"})
+        cls.document_store = documentstore(cls.default_url, cls.default_database)
+        cls.document_store.initialize()
+
+    def test_only_changed_entities_are_saved(self):
+        with self.document_store.open_session() as session:
+            first, second = session.load(["orders/1", "orders/2"], object_type=Order)
+            self.assertEqual(session._entities_to_check(), [])
+            first.lines.append(3)
+            self.assertEqual(session._entities_to_check(), [first])
+            session.save_changes()
+            self.assertEqual(session._entities_to_check(), [])
+
+        with self.document_store.open_session() as session:
+            self.assertEqual(session.load("orders/1", object_type=Order).lines, [1, 2, 3])
+
+    def test_store_new_tracked_entity(self):
+        order = Order("new", TrackedList([TrackedDict({"product": "products/1"})]))
+        with self.document_store.open_session() as session:
+            session.store(order, "orders/3")
+            session.save_changes()
+            order.lines[0]["product"] = "products/2"
+            self.assertEqual(session._entities_to_check(), [order])
+            session.save_changes()
+
+        with self.document_store.open_session() as session:
+            self.assertEqual(session.load("orders/3", object_type=Order).lines[0]["product"], "products/2")
+
+    def test_change_through_the_assigned_list_is_saved(self):
+        lines = [1]
+        order = Order("aliased", lines)
+        self.assertIs(order.lines, lines)
+        with self.document_store.open_session() as session:
+            session.store(order, "orders/4")
+            session.save_changes()
+            lines.append(2)
+            session.save_changes()
+
+        with self.document_store.open_session() as session:
+            self.assertEqual(session.load("orders/4", object_type=Order).lines, [1, 2])
+
+    def test_list_shared_by_two_entities(self):
+        lines = TrackedList([1])
+        first, second = Order("first shared", lines), Order("second shared", lines)
+        self.assertIs(first.lines, second.lines)
+        with self.document_store.open_session() as session:
+            session.store(first, "orders/5")
+            session.store(second, "orders/6")
+            session.save_changes()
+            lines.append(2)
+            self.assertEqual(set(session._entities_to_check()), {first, second})
+            session.save_changes()
+
+        with self.document_store.open_session() as session:
+            first, second = session.load(["orders/5", "orders/6"], object_type=Order)
+            self.assertEqual(first.lines, [1, 2])
+            self.assertEqual(second.lines, [1, 2])
+            first.lines = second.lines
+            self.assertIs(first.lines, second.lines)
+            second.lines.append(3)
+            self.assertEqual(set(session._entities_to_check()), {first, second})
+            session.save_changes()
+
+        with self.document_store.open_session() as session:
+            self.assertEqual(session.load("orders/5", object_type=Order).lines, [1, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,6 +10,27 @@ from pyravendb.d_commands import database_commands
 from pyravendb.data.database import DatabaseDocument
 
 
+class RequestsCounter(object):
+    """
+    Count the http requests that are sent in a with block
+    """
+
+    def __enter__(self):
+        self.count = 0
+        self._http_request_handler = HttpRequestsFactory.http_request_handler
+        http_request_handler = self._http_request_handler
+
+        def counting_http_request_handler(requests_handler, *args, **kwargs):
+            self.count += 1
+            return http_request_handler(requests_handler, *args, **kwargs)
+
+        HttpRequestsFactory.http_request_handler = counting_http_request_handler
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        HttpRequestsFactory.http_request_handler = self._http_request_handler
+
+
 class TestBase(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -0,0 +1,60 @@
+import collections
+import struct
+import sys
+
+if sys.version_info.major > 2:
+    _text_types = (str,)
+    _integer_types = (int,)
+else:
+    _text_types = (str, unicode)
+    _integer_types = (int, long)
+
+_bson_types = (type(None), bool, float, dict, list, tuple, set) + _integer_types + _text_types
+_int32_range = (-2 ** 31, 2 ** 31 - 1)
+_int64_range = (-2 ** 63, 2 ** 63 - 1)
+
+
+def _cstring(value):
+    if not isinstance(value, bytes):
+        value = value.encode("utf-8")
+    return value + b"\x00"
+
+
+def _element(name, value, json_default):
+    name = _cstring(name if isinstance(name, _text_types) else str(name))
+    if not isinstance(value, _bson_types):
+        value = json_default(value)
+    if value is None:
+        return b"\x0A" + name
+    if isinstance(value, bool):
+        return b"\x08" + name + (b"\x01" if value else b"\x00")
+    if isinstance(value, _integer_types):
+        if _int32_range[0] <= value <= _int32_range[1]:
+            return b"\x10" + name + struct.pack("<i", value)
+        if _int64_range[0] <= value <= _int64_range[1]:
+            return b"\x12" + name + struct.pack("<q", value)
+        return b"\x01" + name + struct.pack("<d", value)
+    if isinstance(value, float):
+        return b"\x01" + name + struct.pack("<d", value)
+    if isinstance(value, _text_types):
+        data = value.encode("utf-8")
+        return b"\x02" + name + struct.pack("<i", len(data) + 1) + data + b"\x00"
+    if isinstance(value, dict):
+        return b"\x03" + name + dumps(value, json_default)
+    if isinstance(value, (list, tuple, set)):
+        return b"\x04" + name + dumps(collections.OrderedDict((str(i), item) for i, item in enumerate(value)),
+                                      json_default)
+    raise TypeError("{0!r} cannot be written as BSON".format(value))
+
+
+def dumps(document, json_default):
+    """
+    @param document: the document to write in BSON
+    :type dict
+    @param json_default: converts the values BSON has no type for (like the json default method of the conventions)
+    :type function
+    @return: the BSON of the document
+    :rtype: bytes
+    """
+    elements = b"".join(_element(name, value, json_default) for name, value in document.items())
+    return struct.pack("<i", len(elements) + 5) + elements + b"\x00"
@@ -0,0 +1,95 @@
+from pyravendb.custom_exceptions import exceptions
+import codecs
+import json
+
+_whitespace = " \t\n\r"
+
+
+class _Reader(object):
+    def __init__(self, response, chunk_size):
+        self._chunks = response.iter_content(chunk_size)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.position = 0
+
+    def read(self):
+        """
+        Append the next chunk of the response to the buffer
+
+        @return: False when the response has no more content
+        :rtype: bool
+        """
+        for chunk in self._chunks:
+            text = self._decoder.decode(chunk)
+            if text:
+                # Drop what was already parsed, so the buffer holds about one result at a time
+                self.buffer = self.buffer[self.position:] + text
+                self.position = 0
+                return True
+        return False
+
+    def skip(self, characters):
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in characters:
+                self.position += 1
+            if self.position < len(self.buffer) or not self.read():
+                return
+
+    def read_to_end(self):
+        while self.read():
+            pass
+        return self.buffer[self.position:]
+
+
+def iterate_results(response, property_name="Results", chunk_size=64 * 1024):
+    """
+    Parse the json array of a streamed response item by item, as the content arrives.
+    The response is closed when the iteration ends
+
+    @param response: a response that was requested with stream=True and holds an object like {"Results": [...]}
+    :type requests.Response
+    @param property_name: the name of the array
+    :type str
+    @return: the items of the array
+    :rtype: generator
+    """
+    decoder = json.JSONDecoder()
+    reader = _Reader(response, chunk_size)
+    try:
+        start = '"{0}"'.format(property_name)
+        while reader.buffer.find(start) == -1:
+            if not reader.read():
+                raise exceptions.ErrorResponseException("The stream does not contain {0}".format(property_name))
+        reader.position = reader.buffer.find(start) + len(start)
+        reader.skip(_whitespace + ":")
+        if reader.buffer[reader.position:reader.position + 1] != "[":
+            raise exceptions.ErrorResponseException("{0} is not an array".format(property_name))
+        reader.position += 1
+
+        while True:
+            reader.skip(_whitespace + ",")
+            if reader.position == len(reader.buffer):
+                raise exceptions.ErrorResponseException("The stream ended before all the results were read")
+            if reader.buffer[reader.position] == "]":
+                break
+            try:
+                item, end = decoder.raw_decode(reader.buffer, reader.position)
+            except ValueError:
+                # The item is not complete yet
+                if not reader.read():
+                    raise exceptions.ErrorResponseException("The stream ended before all the results were read")
+                continue
+            reader.position = end
+            yield item
+
+        # The server reports an error that happened after it started to stream as a property after the results
+        rest = reader.read_to_end()[1:].strip().lstrip(",").rstrip("}").strip()
+        if rest:
+            try:
+                error = json.loads("{" + rest + "}").get("Error", None)
+            except ValueError:
+                error = None
+            if error:
+                raise exceptions.ErrorResponseException(error[:100])
+    finally:
+        response.close()
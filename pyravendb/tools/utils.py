@@ -100,19 +100,21 @@ class Utils(object):
             if type_from_metadata is not None:
                 object_from_metadata = Utils.import_class(type_from_metadata)
 
+            # The class is kept aside (and not assigned to entity.__class__) so classes with __slots__ can be used
+            entity_class = _DynamicStructure
             if object_from_metadata is None:
                 if object_type is not None:
-                    entity.__class__ = object_type
+                    entity_class = object_type
                     metadata["Raven-Python-Type"] = "{0}.{1}".format(object_type.__module__, object_type.__name__)
             else:
                 if object_type and not Utils.is_inherit(object_type, object_from_metadata):
                     raise exceptions.InvalidOperationException(
                         "Unable to cast object of type {0} to type {1}".format(object_from_metadata, object_type))
-                entity.__class__ = object_from_metadata
+                entity_class = object_from_metadata
             # Checking the class for initialize
-            entity_initialize_dict = Utils.make_initialize_dict(document, entity.__class__.__init__)
+            entity_initialize_dict = Utils.make_initialize_dict(document, entity_class.__init__)
 
-            entity = entity.__class__(**entity_initialize_dict)
+            entity = entity_class(**entity_initialize_dict)
 
         if nested_object_types:
             for key in nested_object_types: